@@ -1,212 +1,312 @@
 from json_configuration_reader import *
 from binance_interface import *
+from candle_buffer import *
+from market_snapshot import *
+from balance_ledger import *
+from rate_limiter import *
+from client_registry import *
+from market_stream import *
+from tick_scheduler import *
+from metrics import *
 from investment_strategy import *
+from state_store import *
 import datetime as dt
 import time
-import pickle
 import sys
-import json
+import os
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 
+# Max number of configurations processed at the same time
+MAX_WORKERS = 8
 
-def load_internal_state(config: UserConfiguration):
-    file_path = get_absolute_path(
-        "../internal_states/" + config.LOG_NAME + ".state")
-    state = InternalState()
-    state.last_action = Action.NONE
-    state.last_buy_price = 0
-    state.last_action_ts = 0
-    state.last_price_ratio = 0
-    state.considered_long_avg = 0
-    state.considered_short_avg = 0
-    state.current_price_ratio = 0
+# Max request weight per minute sent to binance by all the workers together (the server allows 6000)
+MAX_WEIGHT_PER_MINUTE = 1200
+MAX_WEIGHT_BURST = 200
 
-    # If the file does not exist, return the default internal state
-    if not os.path.exists(file_path):
-        print("[INFO] Non pre existing internal state log file, returning default one")
-        return state
+# Weight kept for the orders, the market data requests never use it
+ORDER_WEIGHT_RESERVE = 10
 
-    # Open the binary file
-    log = open(file_path, "rb")
+# Max seconds between two updates (streaming mode wakes up earlier on market events)
+UPDATE_PERIOD = 20
 
-    # Load the binary state
-    state = pickle.load(log)
-    log.close()
 
-    return state
+# Folder of the console log, the execution logs and the internal states, relative to this script
+OUTPUT_FOLDER = ".."
 
 
-def save_internal_state(config: UserConfiguration, state: InternalState):
-    file_path = get_absolute_path(
-        "../internal_states/" + config.LOG_NAME + ".state")
+def get_output_path(path: str) -> str:
+    return get_absolute_path(os.path.join(OUTPUT_FOLDER, path))
 
-    # Create the file
-    log = open(file_path, "wb")
 
-    # Save the struct
-    pickle.dump(state, log)
-    log.close()
+# Internal states of the configurations, written only when the decisions would change
+STATE_STORE = StateStore(get_output_path("internal_states"))
 
 
-def compute_base_coin_availability(client, config: UserConfiguration, configs, states):
-    # In case the last operation is a BUY, the base coin for this instance is 0
-    if states[config.LOG_NAME].last_action == Action.BUY:
-        return 0
+def set_output_folder(folder: str):
+    # Move all the files written by the invester elsewhere, E.g. a replay must not touch the live states
+    global OUTPUT_FOLDER, STATE_STORE
+    OUTPUT_FOLDER = folder
+    STATE_STORE = StateStore(get_output_path("internal_states"))
 
-    # Sum up all the investments which should have access to the base coin and divide for them
-    counter = 0
 
-    for conf in configs:
-        # The investment should have deposited his part and the base currency type must be the same
-        if states[conf.LOG_NAME].last_action != Action.BUY and conf.BASE_CURRENCY_NAME == config.BASE_CURRENCY_NAME:
-            counter += 1
+def load_internal_state(config: UserConfiguration):
+    return STATE_STORE.load(config.LOG_NAME)
 
-    # Get the amount of base currency
-    base_currency = get_coin_availability(client, config.BASE_CURRENCY_NAME)
 
-    # Divide equally the amount of base currency available
-    return truncate(base_currency / counter, 2)
+def save_internal_state(config: UserConfiguration, state: InternalState):
+    STATE_STORE.save(config.LOG_NAME, state)
+
+
+def update_state(config: UserConfiguration, states: dict, snapshot: MarketSnapshot, ledger: BalanceLedger):
+    state = states[config.LOG_NAME]
+
+    # Update the internal state with fresh data
+    state.timestamp = snapshot.timestamp
+    state.current_price = snapshot.get_price(config.COIN_NAME)
+    state.current_coin_availability = ledger.get_coin_availability(
+        config, states)
+    state.current_base_coin_availability = ledger.get_base_coin_availability(
+        config, states)
+    state.considered_avg = snapshot.get_avg_price(
+        config.COIN_NAME, config.AVG_HRS)
+
+    # If needed check also the long/short average
+    if config.LONG_AVG_HRS != 0 and config.SHORT_AVG_HRS != 0:
+        state.considered_long_avg = snapshot.get_avg_price(
+            config.COIN_NAME, config.LONG_AVG_HRS)
+        state.considered_short_avg = snapshot.get_avg_price(
+            config.COIN_NAME, config.SHORT_AVG_HRS)
+
+        # Update price ratios
+        state.last_price_ratio = state.current_price_ratio
+        state.current_price_ratio = state.considered_short_avg / state.considered_long_avg
+
+
+def process_config(config: UserConfiguration, state: InternalState, client: Spot, exchange_cache: ExchangeCache, clock: ServerClock):
+    try:
+        # Age of the market data the decision is based on
+        METRICS.observe("price_age_seconds", max(0, time.time() + clock.offset - state.timestamp),
+                        AGE_BUCKETS, config=config.LOG_NAME)
+
+        # Make decision
+        with METRICS.timer("decision", config=config.LOG_NAME):
+            decision = make_decision(state, config)
+
+        # Actuate the decision
+        if decision == Action.BUY:
+            # Buy coins
+            action_result = (True, "")
+
+            if not config.TEST_MODE:
+                action_result = buy_coin(client, config.COIN_NAME,
+                                         state.current_base_coin_availability, clock.get_timestamp(client))
+
+            if action_result[0]:
+                # Register the purchase details
+                state.last_buy_price = state.current_price
+                state.last_action = decision
+                state.last_action_ts = state.timestamp
+
+                # Log the event, written immediately
+                with METRICS.timer("log_write", config=config.LOG_NAME):
+                    log_data(get_output_path(
+                        "execution_logs/" + config.LOG_NAME + ".ev"), state, True)
+            else:
+                METRICS.increment("order_errors_total",
+                                  config=config.LOG_NAME, side="BUY")
+                print(
+                    f"[{state.timestamp}][{dt.datetime.fromtimestamp(state.timestamp)}][ERR][BUY] Error during buy transaction: {action_result[1]}")
+
+        elif decision == Action.SELL or decision == Action.SELL_LOSS:
+            # Sell coins
+            action_result = (True, "")
+
+            if not config.TEST_MODE:
+                symbol = exchange_cache.get_symbol(client, config.COIN_NAME)
+                action_result = sell_coin(client, config.COIN_NAME,
+                                          state.current_coin_availability, symbol.lot_increment, clock.get_timestamp(client))
+
+            if action_result[0]:
+                # Register the sell details
+                state.last_action = decision
+                state.last_action_ts = state.timestamp
+
+                # Log the event, written immediately
+                with METRICS.timer("log_write", config=config.LOG_NAME):
+                    log_data(get_output_path(
+                        "execution_logs/" + config.LOG_NAME + ".ev"), state, True)
+            else:
+                METRICS.increment("order_errors_total",
+                                  config=config.LOG_NAME, side="SELL")
+                print(
+                    f"[{state.timestamp}][{dt.datetime.fromtimestamp(state.timestamp)}][ERR][SELL] Error during sell transaction: {action_result[1]}")
 
+        # Save the internal state in case of a restart, only if something relevant changed
+        with METRICS.timer("state_save", config=config.LOG_NAME):
+            save_internal_state(config, state)
 
-def compute_coin_availability(client, config: UserConfiguration, configs, states):
-    # In case the last operation is a SELL / SELL_LOSS or NONE, the coin for this instance is 0
-    if states[config.LOG_NAME].last_action == Action.SELL or \
-        states[config.LOG_NAME].last_action == Action.SELL_LOSS or \
-            states[config.LOG_NAME].last_action == Action.NONE:
-        return 0
+        # Log the internal state, rotated into compressed segments
+        with METRICS.timer("log_write", config=config.LOG_NAME):
+            log_data(get_output_path(
+                "execution_logs/" + config.LOG_NAME + ".log"), state, rotate=True)
+        print(
+            f"[{state.timestamp}][{dt.datetime.fromtimestamp(state.timestamp)}][INFO] Logged data")
 
-    # Sum up all the investments which should have access to the investment coin and divide for them
-    counter = 0
+    except Exception as e:
+        METRICS.increment("process_errors_total", config=config.LOG_NAME)
+        print(
+            f"[{state.timestamp}][{dt.datetime.fromtimestamp(state.timestamp)}][ERR] Caught unhandled exception during the process: {str(e)}")
 
-    for conf in configs:
-        # The investment should have bought his part and the investment currency type must be the same
-        if states[conf.LOG_NAME].last_action == Action.BUY and conf.CURRENCY_NAME == config.CURRENCY_NAME:
-            counter += 1
 
-    # Get the amount of investment currency
-    currency = get_coin_availability(client, config.CURRENCY_NAME)
+def run_invester(configs: list[UserConfiguration], registry: ClientRegistry, limiter: RateLimiter, period: int = UPDATE_PERIOD, stream_url: str = None, metrics_port: int = None, metrics_host: str = METRICS_HOST):
+    # Load the internal states
+    states = {}
+    for config in configs:
+        state = load_internal_state(config)
+        states[config.LOG_NAME] = state
 
-    # Divide equally the amount of base currency available
-    return truncate(currency / counter, 8)
+    # Create the per coin candle buffers (restored or seeded at the first update)
+    candle_buffers = create_candle_buffers(
+        configs, get_output_path(CANDLES_FOLDER))
 
+    # Collect the distinct market data needed by all the configurations
+    market_requests = gather_market_requests(configs)
 
-def main():
-    # Delay on startup
-    time.sleep(10)
+    # Share the workers among all the configurations
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
 
-    # Set the std output to a log file
-    new_stdout = open(get_absolute_path("../console.log"), "a")
-    sys.stdout = new_stdout
-    sys.stderr = new_stdout
+    # Cache the exchange filters and the server clock offset out of the order path
+    exchange_cache = ExchangeCache([config.COIN_NAME for config in configs])
+    clock = ServerClock()
+    try:
+        client = registry.get_client(configs[0].KEY_FILE_NAME)
+        exchange_cache.refresh(client)
+        clock.sync(client)
+    except Exception as e:
+        print(
+            f"[{dt.datetime.now()}][ERR] Unable to load the exchange information: {str(e)}")
 
-    # Read the user configuration
-    configs = read_user_configurations("../invester_config.json")
+    # Ticks aligned to the server minutes, so that every update sees the last candles closed
+    scheduler = TickScheduler(period, clock, limiter)
 
-    # Load the internal states
-    states = {}
-    for config in configs:
-        state = load_internal_state(config)
-        states[config.LOG_NAME] = state
+    # Receive prices and candles as soon as they change when the streaming mode is enabled
+    stream = None
+    if stream_url is not None:
+        stream = MarketStream(
+            [config.COIN_NAME for config in configs], candle_buffers, stream_url)
+
+    # Expose the metrics to a Prometheus scraper
+    if metrics_port is not None:
+        serve_metrics(METRICS, int(metrics_port), metrics_host)
 
     # Update loop
     while True:
+        tick_start = time.perf_counter()
+
+        # Fetch the market data once for all the configurations
+        try:
+            # Reuse the clients (reloaded only if their key file changed)
+            clients = {}
+            for config in configs:
+                if config.KEY_FILE_NAME not in clients:
+                    clients[config.KEY_FILE_NAME] = registry.get_client(
+                        config.KEY_FILE_NAME)
+
+            # Connect again the stream if it dropped, falling back to polling in case of failure
+            if stream is not None and not stream.connected:
+                try:
+                    stream.connect()
+                except Exception as e:
+                    print(
+                        f"[{dt.datetime.now()}][ERR] Unable to connect to the market stream: {str(e)}")
+
+            with METRICS.timer("market_data"):
+                if stream is not None and stream.connected:
+                    snapshot = take_stream_snapshot(
+                        clients[configs[0].KEY_FILE_NAME], stream, market_requests, clock)
+                else:
+                    snapshot = take_market_snapshot(
+                        clients[configs[0].KEY_FILE_NAME], market_requests, candle_buffers, clock, executor)
+        except Exception as e:
+            print(
+                f"[{dt.datetime.now()}][ERR] Unable to gather the market data: {str(e)}")
+            sys.stdout.flush()
+            scheduler.wait()
+            continue
+
+        # Fetch the balances once for every account and split them among the configurations
+        ledger = BalanceLedger()
+        list(executor.map(lambda key_file_name: ledger.refresh(
+            key_file_name, clients[key_file_name]), clients))
+        ledger.count_peers(configs, states)
+
+        # Assign the shares before any order so that concurrent decisions split the same balances
+        ready_configs = []
         for config in configs:
-            # Setup the API client
-            with open(get_absolute_path("../" + config.KEY_FILE_NAME), 'rb') as key_file:
-                key = key_file.read()
-                key = json.loads(key)
-
-            # Create the client REST object
-            client = Spot(api_key=key["APIKey"], private_key=key["privateKey"])
-
-            # Init the internal state
             state = states[config.LOG_NAME]
-
             try:
-                # Update the internal state with fresh data
-                state.timestamp = get_server_timestamp(client)
-                state.current_price = get_current_price(
-                    client, config.COIN_NAME)
-                state.current_coin_availability = compute_coin_availability(
-                    client, config, configs, states)
-                state.current_base_coin_availability = compute_base_coin_availability(
-                    client, config, configs, states)
-                state.considered_avg = get_avg_price(
-                    client, config.COIN_NAME, config.AVG_HRS, state.timestamp)
-
-                # If needed check also the long/short average
-                if config.LONG_AVG_HRS != 0 and config.SHORT_AVG_HRS != 0:
-                    state.considered_long_avg = get_avg_price(
-                        client, config.COIN_NAME, config.LONG_AVG_HRS, state.timestamp)
-                    state.considered_short_avg = get_avg_price(
-                        client, config.COIN_NAME, config.SHORT_AVG_HRS, state.timestamp)
-
-                    # Update price ratios
-                    state.last_price_ratio = state.current_price_ratio
-                    state.current_price_ratio = state.considered_short_avg / state.considered_long_avg
-
-                # Make decision
-                decision = make_decision(state, config)
-
-                # Actuate the decision
-                if decision == Action.BUY:
-                    # Buy coins
-                    action_result = (True, "")
-
-                    if not config.TEST_MODE:
-                        action_result = buy_coin(client, config.COIN_NAME,
-                                                 state.current_base_coin_availability)
-
-                    if action_result[0]:
-                        # Register the purchase details
-                        state.last_buy_price = state.current_price
-                        state.last_action = decision
-                        state.last_action_ts = state.timestamp
-
-                        # Log the event
-                        log_data(get_absolute_path(
-                            "../execution_logs/" + config.LOG_NAME + ".ev"), state)
-                    else:
-                        print(
-                            f"[{state.timestamp}][{dt.datetime.fromtimestamp(state.timestamp)}][ERR][BUY] Error during buy transaction: {action_result[1]}")
-
-                elif decision == Action.SELL or decision == Action.SELL_LOSS:
-                    # Sell coins
-                    action_result = (True, "")
-
-                    if not config.TEST_MODE:
-                        action_result = sell_coin(client, config.COIN_NAME,
-                                                  state.current_coin_availability)
-
-                    if action_result[0]:
-                        # Register the sell details
-                        state.last_action = decision
-                        state.last_action_ts = state.timestamp
-
-                        # Log the event
-                        log_data(get_absolute_path(
-                            "../execution_logs/" + config.LOG_NAME + ".ev"), state)
-                    else:
-                        print(
-                            f"[{state.timestamp}][{dt.datetime.fromtimestamp(state.timestamp)}][ERR][SELL] Error during sell transaction: {action_result[1]}")
-
-                # Save the internal in case of a restart
-                save_internal_state(config, state)
-
-                # Log the internal state
-                log_data(get_absolute_path(
-                    "../execution_logs/" + config.LOG_NAME + ".log"), state)
-                print(
-                    f"[{state.timestamp}][{dt.datetime.fromtimestamp(state.timestamp)}][INFO] Logged data")
-
-                # Flush the console log
-                new_stdout.flush()
-
+                update_state(config, states, snapshot, ledger)
+                ready_configs.append(config)
             except Exception as e:
                 print(
                     f"[{state.timestamp}][{dt.datetime.fromtimestamp(state.timestamp)}][ERR] Caught unhandled exception during the process: {str(e)}")
 
-        # Sleep until next update
-        time.sleep(20)
+        # Decide and actuate all the configurations concurrently
+        list(executor.map(lambda config: process_config(
+            config, states[config.LOG_NAME], clients[config.KEY_FILE_NAME], exchange_cache, clock), ready_configs))
+
+        # Duration of the whole update, the metrics file is rewritten once in a while
+        METRICS.observe("tick_seconds", time.perf_counter() - tick_start)
+        METRICS.write_periodically(get_output_path(METRICS_FILE))
+
+        # Flush the console log
+        sys.stdout.flush()
+
+        # Sleep until next update, aligned to the minute candles and slowed down if the budget is exceeded
+        scheduler.adapt()
+        if stream is not None and stream.connected:
+            stream.set_thresholds(configs, states)
+            stream.wait(scheduler.get_delay())
+        else:
+            time.sleep(scheduler.get_delay())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="The automatic invester that trades following the configurations in invester_config.json")
+    parser.add_argument("-s", "--stream", action="store_true",
+                        help="receive the market data through the binance websocket streams instead of polling the REST API")
+    parser.add_argument("--stream-url", default=STREAM_URL,
+                        help=f"the market stream endpoint, E.g. a local replay server (Default: {STREAM_URL})")
+    parser.add_argument("-w", "--weight-budget", default=MAX_WEIGHT_PER_MINUTE,
+                        help=f"max binance request weight used in a minute, the updates are slowed down to stay under it (Default: {MAX_WEIGHT_PER_MINUTE})")
+    parser.add_argument("--metrics-port", default=None,
+                        help=f"serve the latency metrics on http://<host>:<port>/metrics, they are always written to {METRICS_FILE}")
+    parser.add_argument("--metrics-host", default=METRICS_HOST,
+                        help=f"the interface of the metrics server, E.g. 0.0.0.0 for remote scrapers (Default: {METRICS_HOST})")
+
+    # Parse the input data from user
+    args = parser.parse_args()
+
+    # Delay on startup
+    time.sleep(10)
+
+    # Set the std output to a log file
+    new_stdout = open(get_output_path("console.log"), "a")
+    sys.stdout = new_stdout
+    sys.stderr = new_stdout
+
+    # Read the user configuration
+    configs = read_user_configurations("../invester_config.json")
+
+    # Share the request budget and the connections among all the configurations
+    limiter = RateLimiter(int(args.weight_budget) / 60,
+                          MAX_WEIGHT_BURST, ORDER_WEIGHT_RESERVE)
+    registry = ClientRegistry(limiter, MAX_WORKERS)
+
+    run_invester(configs, registry, limiter, UPDATE_PERIOD,
+                 args.stream_url if args.stream else None, args.metrics_port, args.metrics_host)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,65 @@
+from binance_interface import *
+from investment_strategy import *
+
+
+class BalanceLedger:
+    def __init__(self):
+        # Free amount of every asset, indexed by key file (every key file is a different account)
+        self.balances = {}
+
+        # Number of configurations sharing the base currency / holding the investment currency
+        self.base_peers = {}
+        self.coin_peers = {}
+
+        # Error message for every account whose balances could not be gathered
+        self.errors = {}
+
+    def refresh(self, key_file_name: str, client: Spot):
+        # A single account request serves all the configurations on the same account
+        try:
+            self.balances[key_file_name] = get_account_balances(client)
+            self.errors.pop(key_file_name, None)
+        except Exception as e:
+            self.balances.pop(key_file_name, None)
+            self.errors[key_file_name] = str(e)
+
+    def count_peers(self, configs: list[UserConfiguration], states: dict):
+        self.base_peers = {}
+        self.coin_peers = {}
+
+        for conf in configs:
+            # The investment should have bought his part to share the investment currency,
+            # otherwise it has deposited his part and shares the base currency
+            if states[conf.LOG_NAME].last_action == Action.BUY:
+                self.coin_peers[conf.CURRENCY_NAME] = self.coin_peers.get(
+                    conf.CURRENCY_NAME, 0) + 1
+            else:
+                self.base_peers[conf.BASE_CURRENCY_NAME] = self.base_peers.get(
+                    conf.BASE_CURRENCY_NAME, 0) + 1
+
+    def get_balance(self, key_file_name: str, currency_name: str) -> float:
+        # Propagate the error so that every configuration on the same account reports it
+        if key_file_name in self.errors:
+            raise Exception(
+                f"[ERR] Balances for {key_file_name} not available: {self.errors[key_file_name]}")
+
+        return self.balances[key_file_name].get(currency_name, 0)
+
+    def get_base_coin_availability(self, config: UserConfiguration, states: dict) -> float:
+        # In case the last operation is a BUY, the base coin for this instance is 0
+        if states[config.LOG_NAME].last_action == Action.BUY:
+            return 0
+
+        # Divide equally the amount of base currency available
+        base_currency = self.get_balance(
+            config.KEY_FILE_NAME, config.BASE_CURRENCY_NAME)
+        return truncate(base_currency / self.base_peers[config.BASE_CURRENCY_NAME], 2)
+
+    def get_coin_availability(self, config: UserConfiguration, states: dict) -> float:
+        # In case the last operation is a SELL / SELL_LOSS or NONE, the coin for this instance is 0
+        if states[config.LOG_NAME].last_action != Action.BUY:
+            return 0
+
+        # Divide equally the amount of investment currency available
+        currency = self.get_balance(config.KEY_FILE_NAME, config.CURRENCY_NAME)
+        return truncate(currency / self.coin_peers[config.CURRENCY_NAME], 8)
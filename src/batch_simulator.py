@@ -0,0 +1,189 @@
+from simulation_kernel import *
+from time_series import *
+import numpy as np
+
+# Integer codes of the actions inside the batch arrays
+ACTION_CODES = {action.value: action for action in Action}
+
+
+def group_by_indicators(configs: list[UserConfiguration]) -> dict:
+    # The configurations with the same algorithm and windows share the same indicators
+    groups = {}
+    for i in range(len(configs)):
+        config = configs[i]
+        key = (config.ALGORITHM_TYPE, config.AVG_HRS,
+               config.SHORT_AVG_HRS, config.LONG_AVG_HRS)
+        groups.setdefault(key, []).append(i)
+
+    return groups
+
+
+def simulate_batch(configs: list[UserConfiguration], data_ts: list, data_price: list, series: TimeSeries = None) -> list[SimulationEvents]:
+    # The series can be shared among all the groups
+    if series is None:
+        series = TimeSeries(data_ts, data_price)
+
+    results = [None] * len(configs)
+    for indexes in group_by_indicators(configs).values():
+        group = [configs[i] for i in indexes]
+        config = group[0]
+
+        # Invalid windows are rejected with the same empty events of simulate
+        if config.SHORT_AVG_HRS > config.LONG_AVG_HRS and config.LONG_AVG_HRS != 0 and config.SHORT_AVG_HRS:
+            print("[ERR] Long average is less than small average")
+            for i in indexes:
+                results[i] = SimulationEvents([], InternalState())
+            continue
+
+        # Compute the indicators once and run all the configurations of the group on them
+        indicators = compute_indicators(config, data_ts, data_price, series)
+        group_results = run_batch_state_machine(group, indicators)
+        for i in range(len(indexes)):
+            results[indexes[i]] = group_results[i]
+
+    return results
+
+
+def run_batch_state_machine(configs: list[UserConfiguration], indicators: KernelResult) -> list[SimulationEvents]:
+    timestamps = indicators.timestamps
+    prices = indicators.prices
+    avgs = indicators.avg
+    count = len(timestamps)
+    size = len(configs)
+
+    # One element per configuration for every parameter of the decision functions
+    is_threshold = configs[0].ALGORITHM_TYPE == AlgorithmType.THRESHOLD
+    is_crossover = configs[0].ALGORITHM_TYPE == AlgorithmType.CROSSOVER
+    min_gain = np.array([config.MIN_GAIN / 100.0 for config in configs])
+    min_cross_gain = np.array(
+        [1 + (config.BUY_TAX + config.SELL_TAX) / 100 for config in configs])
+    has_stop_loss = np.array([config.STOP_LOSS != 0 for config in configs])
+    stop_loss = np.array([config.STOP_LOSS / 100.0 for config in configs])
+    buy_delta = np.array([(config.BUY_TAX + config.SELL_TAX +
+                         config.MIN_DELTA) / 100.0 for config in configs])
+    sleep_seconds = np.array(
+        [config.SLEEP_DAYS_AFTER_LOSS * 24 * 60 * 60 for config in configs])
+    buy_tax = np.array([config.BUY_TAX / 100.0 for config in configs])
+    sell_tax = np.array([config.SELL_TAX / 100.0 for config in configs])
+
+    # State of every configuration
+    last_action = np.full(size, Action.NONE.value, dtype=np.int8)
+    last_action_ts = np.zeros(size, dtype=np.int64)
+    last_buy_price = np.zeros(size)
+    coin = np.zeros(size)
+    base = np.full(size, float(INITIAL_INVESTMENT))
+    events = [[] for i in range(size)]
+
+    # Searches of the samples where a configuration may change its state
+    index = EventIndex(indicators)
+    min_buy_delta = buy_delta.min()
+
+    # Only the algorithms known by make_decision take actions
+    if not is_threshold and not is_crossover:
+        candidates_left = False
+    else:
+        candidates_left = True
+
+    i = 0
+    while candidates_left:
+        holding = last_action == Action.BUY.value
+
+        # Look for the next sample where any configuration may change its state
+        next_index = count
+        if not holding.all():
+            # The configurations sleeping after a stop loss cannot buy, the smallest delta has the highest threshold
+            sleep_end = np.where(last_action == Action.SELL_LOSS.value,
+                                 last_action_ts + sleep_seconds, 0)
+            start = index.find_sleep_end(i, sleep_end[~holding].min(), 0)
+            next_index = min(
+                next_index, index.find_next_buy(start, min_buy_delta))
+
+        if holding.any():
+            if is_threshold:
+                # Lowest price that makes a holding configuration sell
+                sellers = holding & (min_gain < 1)
+                if sellers.any():
+                    threshold = (last_buy_price[sellers] /
+                                 (1 - min_gain[sellers])).min()
+                    next_index = min(next_index, index.price_search.find_first_above(
+                        i, threshold * (1 - CANDIDATE_MARGIN)))
+            else:
+                next_index = min(next_index, index.find_next_cross(i))
+
+            # Highest average that makes a holding configuration stop its loss
+            losers = holding & has_stop_loss
+            if losers.any():
+                threshold = (last_buy_price[losers] *
+                             (1 - stop_loss[losers])).max()
+                next_index = min(next_index, index.avg_search.find_first_above(
+                    i, -threshold * (1 + CANDIDATE_MARGIN)))
+
+        if next_index >= count:
+            break
+        i = int(next_index)
+
+        # Same checks of the decision functions, for all the configurations at once
+        price = prices[i]
+        avg = avgs[i]
+        timestamp = timestamps[i]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if is_threshold:
+                sell = holding & ((1 - (last_buy_price / price)) > min_gain)
+            else:
+                sell = holding & (indicators.current_ratio[i] <= 1) & (indicators.last_ratio[i] > 1) & \
+                    (price / last_buy_price > min_cross_gain)
+            sell_loss = holding & ~sell & has_stop_loss & (
+                (1 - avg / last_buy_price) > stop_loss)
+
+        buy = ~holding & ((last_action != Action.SELL_LOSS.value) | (timestamp - last_action_ts > sleep_seconds)) & \
+            (price <= (avg - avg * buy_delta)) & (base != 0)
+
+        # Update the internal states as the simulator does
+        if buy.any():
+            investment = base[buy]
+            last_buy_price[buy] = price
+            coin[buy] = (investment - buy_tax[buy] * investment) / price
+            base[buy] = 0
+            last_action[buy] = Action.BUY.value
+
+        sold = sell | sell_loss
+        if sold.any():
+            value = coin[sold] * price
+            base[sold] += value - sell_tax[sold] * value
+            coin[sold] = 0
+            last_action[sell] = Action.SELL.value
+            last_action[sell_loss] = Action.SELL_LOSS.value
+
+        # Register the events
+        acted = buy | sold
+        last_action_ts[acted] = timestamp
+        for k in np.flatnonzero(acted).tolist():
+            events[k].append(SimulationEvent(i, int(timestamp), ACTION_CODES[int(last_action[k])], float(price),
+                                             float(coin[k]), float(base[k])))
+
+        i += 1
+
+    # Build the final state of every configuration
+    results = []
+    last = count - 1
+    for k in range(size):
+        state = InternalState()
+        state.timestamp = int(timestamps[last])
+        state.current_price = float(prices[last])
+        state.current_price_ratio = float(indicators.current_ratio[last])
+        state.last_price_ratio = float(indicators.last_ratio[last])
+        state.considered_avg = float(avgs[last])
+        state.considered_short_avg = float(indicators.short_avg[last])
+        state.considered_long_avg = float(indicators.long_avg[last])
+        state.current_base_coin_availability = INITIAL_INVESTMENT
+
+        if len(events[k]) != 0:
+            state.last_action = ACTION_CODES[int(last_action[k])]
+            state.last_action_ts = int(last_action_ts[k])
+            state.last_buy_price = float(last_buy_price[k])
+            state.current_coin_availability = float(coin[k])
+            state.current_base_coin_availability = float(base[k])
+
+        results.append(SimulationEvents(events[k], state))
+
+    return results
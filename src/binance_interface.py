@@ -1,4 +1,5 @@
 from binance.spot import Spot
+from fixed_point import *
 import math
 
 
@@ -44,6 +45,18 @@ def get_coin_availability(client: Spot, currency_name: str):
     return 0
 
 
+def get_account_balances(client: Spot) -> dict:
+    data = client.account()
+
+    # Index all the free amounts by asset with a single request
+    balances = {}
+    for balance in data["balances"]:
+        # Approximate in defect the amount (8 decimals)
+        balances[balance["asset"]] = truncate(float(balance["free"]), 8)
+
+    return balances
+
+
 def get_server_timestamp(client: Spot):
     data = client.time()
 
@@ -51,6 +64,17 @@ def get_server_timestamp(client: Spot):
     return int(data["serverTime"]) // 1000
 
 
+def get_symbols_filters(client: Spot, coin_names: list[str]) -> dict:
+    # Request the exchange information of all the coins at once
+    data = client.exchange_info(symbols=coin_names)
+
+    filters = {}
+    for symbol in data["symbols"]:
+        filters[symbol["symbol"]] = symbol["filters"]
+
+    return filters
+
+
 def get_avg_price(client: Spot, coin_name: str, avg_hrs: int, starting_timestamp: int):
     # Max number of candles that binance can send in one packet
     MAX_CANDLES = 1000
@@ -63,12 +87,17 @@ def get_avg_price(client: Spot, coin_name: str, avg_hrs: int, starting_timestamp
 
     # Iterate with 1m candles requests (to have the most precise estimation) until all the average hours are collected
     requested_candles = 0
-    result = 0.0
+    end_time = starting_timestamp * 1000
+    result = 0
     sum_number = 0
     while requested_candles < number_candles:
         # Request candles
         data = client.klines(coin_name, "1m",
-                             endTime=(starting_timestamp - requested_candles * 60) * 1000, limit=min(number_candles - requested_candles, MAX_CANDLES))
+                             endTime=end_time, limit=min(number_candles - requested_candles, MAX_CANDLES))
+
+        # Stop in case the coin does not have enough history
+        if len(data) == 0:
+            break
 
         # Sum the average among open and close prices
         for candle in data:
@@ -76,23 +105,25 @@ def get_avg_price(client: Spot, coin_name: str, avg_hrs: int, starting_timestamp
             if (candle[0] / 1000 > target_timestamp):
                 open = candle[1]
                 close = candle[4]
-                result += (float(open) + float(close)) / 2.0
+
+                # Fixed point (open + close), exact whatever the order of the sums
+                result += to_fixed_point(open) + to_fixed_point(close)
 
                 # Count the number of sums to make the average at the end
                 sum_number += 1
 
-        # Update the requested candles
+        # Update the requested candles, the next page ends before the oldest received candle so that
+        # the pages never overlap, even after a gap in the candles of the exchange
         requested_candles += len(data)
+        end_time = data[0][0] - 1
 
-    # Average the final result
-    result = result / sum_number
+    # Average the final result, rounded only once by the division
+    result = result / (2 * PRICE_SCALE * sum_number)
 
     return truncate(result, 9)
 
 
-def sell_coin(client: Spot, coin_name: str, amount: float) -> tuple:
-    # Get the maximum precision that the API accepts for the coin
-    filters = client.exchange_info(symbol=coin_name)["symbols"][0]["filters"]
+def get_lot_increment(filters: list) -> int:
     increment = 1
 
     # Look for the minimum increment
@@ -101,11 +132,22 @@ def sell_coin(client: Spot, coin_name: str, amount: float) -> tuple:
             increment = get_increment_from_string(filter["stepSize"])
             break
 
+    return increment
+
+
+def sell_coin(client: Spot, coin_name: str, amount: float, increment: int = None, timestamp: int = None) -> tuple:
+    # Get the maximum precision that the API accepts for the coin (if not already cached by the caller)
+    if increment is None:
+        filters = client.exchange_info(symbol=coin_name)[
+            "symbols"][0]["filters"]
+        increment = get_lot_increment(filters)
+
     # Process the amount to truncate instead of approximate of the desired increment
     amount = truncate(amount, increment)
 
     # Get the order timestamp
-    timestamp = get_server_timestamp(client)
+    if timestamp is None:
+        timestamp = get_server_timestamp(client)
 
     # Make the order (using formatted amount to avoid scientific notation)
     result = client.new_order(symbol=coin_name, side="SELL",
@@ -114,12 +156,13 @@ def sell_coin(client: Spot, coin_name: str, amount: float) -> tuple:
     return (result["status"] == "FILLED", str(result))
 
 
-def buy_coin(client: Spot, coin_name: str, amount: float) -> tuple:
+def buy_coin(client: Spot, coin_name: str, amount: float, timestamp: int = None) -> tuple:
     # Process the amount to truncate instead of approximate
     amount = truncate(amount, 2)
 
     # Get the order timestamp
-    timestamp = get_server_timestamp(client)
+    if timestamp is None:
+        timestamp = get_server_timestamp(client)
 
     # Make the order
     result = client.new_order(symbol=coin_name, side="BUY", type="MARKET",
@@ -0,0 +1,307 @@
+from binance_interface import *
+from json_configuration_reader import *
+import bisect
+import json
+import os
+
+# Duration of a single 1m candle in seconds
+CANDLE_SECONDS = 60
+
+# Durations of the aggregated buckets, from the finest to the coarsest one
+BUCKET_SECONDS = [15 * 60, 60 * 60]
+
+# Folder of the aggregated candles of every coin (inside the invester output folder), they spare the
+# download of the whole window at restart
+CANDLES_FOLDER = "internal_states"
+CANDLES_VERSION = 1
+
+
+def get_candle_value(open: float, close: float) -> int:
+    # Fixed point (open + close) as summed by get_avg_price, the average divides it by 2 * PRICE_SCALE
+    return to_fixed_point(open) + to_fixed_point(close)
+
+
+class CandleBuffer:
+    def __init__(self, coin_name: str, max_hrs: int, path: str = None):
+        self.coin_name = coin_name
+        self.max_hrs = max_hrs
+        self.path = path
+
+        # Buffered candles (oldest first): open timestamp in seconds and fixed point (open + close) value
+        self.candle_ts = []
+        self.candle_value = []
+
+        # Sum and number of the closed candles of every bucket, indexed by the bucket start
+        self.buckets = {seconds: {} for seconds in BUCKET_SECONDS}
+
+        # True when the last buffered candle was still open at the time of the last fetch
+        self.last_is_open = False
+
+        # Start of the last bucket written to disk
+        self.saved_bucket = 0
+
+    def max_candles(self) -> int:
+        return (self.max_hrs * 60 * 60) // CANDLE_SECONDS
+
+    def is_seeded(self) -> bool:
+        return len(self.candle_ts) != 0
+
+    def clear(self):
+        self.candle_ts = []
+        self.candle_value = []
+        self.buckets = {seconds: {} for seconds in BUCKET_SECONDS}
+        self.last_is_open = False
+
+    def aggregate(self, open_ts: int, value: int):
+        # Add a closed candle to the buckets containing it
+        for seconds, buckets in self.buckets.items():
+            bucket = buckets.setdefault(open_ts - open_ts % seconds, [0, 0])
+            bucket[0] += value
+            bucket[1] += 1
+
+    def append_candles(self, data: list, timestamp: int):
+        for candle in data:
+            open_ts = candle[0] // 1000
+
+            # Skip candles that are already buffered (the pages may overlap)
+            if len(self.candle_ts) != 0 and open_ts <= self.candle_ts[-1]:
+                continue
+
+            # A newer candle closes the previous one
+            if self.last_is_open:
+                self.aggregate(self.candle_ts[-1], self.candle_value[-1])
+                self.last_is_open = False
+
+            value = get_candle_value(candle[1], candle[4])
+            self.candle_ts.append(open_ts)
+            self.candle_value.append(value)
+
+            # The most recent candle is not closed yet if its minute is still running
+            if open_ts + CANDLE_SECONDS > timestamp:
+                self.last_is_open = True
+            else:
+                self.aggregate(open_ts, value)
+
+    def drop_open_candle(self):
+        # Remove the last candle since it changed after the previous fetch
+        if self.last_is_open:
+            self.candle_ts.pop()
+            self.candle_value.pop()
+            self.last_is_open = False
+
+    def trim(self, timestamp: int):
+        # Compact only when the buffer doubled its size, so that the cost is amortized among the ticks
+        if len(self.candle_ts) < 2 * self.max_candles():
+            return
+
+        window_start = timestamp - self.max_hrs * 60 * 60
+        first = bisect.bisect_right(self.candle_ts, window_start)
+        self.candle_ts = self.candle_ts[first:]
+        self.candle_value = self.candle_value[first:]
+
+        # Drop the buckets ended before the widest window
+        for seconds, buckets in self.buckets.items():
+            self.buckets[seconds] = {start: bucket for start, bucket in buckets.items()
+                                     if start + seconds > window_start}
+
+    def seed(self, client: Spot, timestamp: int):
+        # Max number of candles that binance can send in one packet
+        MAX_CANDLES = 1000
+
+        self.clear()
+
+        # Download the whole window going backwards in time, as done by get_avg_price
+        number_candles = self.max_candles()
+        pages = []
+        requested_candles = 0
+        end_time = timestamp * 1000
+        while requested_candles < number_candles:
+            data = client.klines(self.coin_name, "1m",
+                                 endTime=end_time, limit=min(number_candles - requested_candles, MAX_CANDLES))
+
+            # Stop in case the coin does not have enough history
+            if len(data) == 0:
+                break
+
+            pages.append(data)
+            requested_candles += len(data)
+            end_time = data[0][0] - 1
+
+        # Insert the pages from the oldest to the newest one
+        for data in reversed(pages):
+            self.append_candles(data, timestamp)
+
+    def update(self, client: Spot, timestamp: int):
+        # Max number of candles that binance can send in one packet
+        MAX_CANDLES = 1000
+
+        # Start from the candles saved by the previous run
+        if not self.is_seeded():
+            self.load(timestamp)
+
+        # In case the buffer is empty or older than the window, download it again
+        if not self.is_seeded() or \
+                (timestamp - self.candle_ts[-1]) // CANDLE_SECONDS >= self.max_candles():
+            self.seed(client, timestamp)
+            self.save_completed(timestamp)
+            return
+
+        # Request only the candles that were not closed during the last fetch, page after page
+        self.drop_open_candle()
+        if not self.is_seeded():
+            self.seed(client, timestamp)
+            self.save_completed(timestamp)
+            return
+
+        while True:
+            data = client.klines(self.coin_name, "1m",
+                                 startTime=(self.candle_ts[-1] + CANDLE_SECONDS) * 1000, endTime=timestamp * 1000, limit=MAX_CANDLES)
+            self.append_candles(data, timestamp)
+            if len(data) < MAX_CANDLES:
+                break
+
+        self.trim(timestamp)
+        self.save_completed(timestamp)
+
+    def push_candle(self, open_ts: int, open: float, close: float, closed: bool) -> bool:
+        # The running candle is replaced by its newer versions until it closes
+        if self.last_is_open and self.candle_ts[-1] == open_ts:
+            self.drop_open_candle()
+
+        # Refuse candles leaving a hole in the buffer (E.g. a lost stream message), the caller
+        # shall fill it through the REST API with update()
+        if not self.is_seeded() or open_ts > self.candle_ts[-1] + CANDLE_SECONDS:
+            return False
+
+        # The candle has the same layout of the klines API one
+        timestamp = open_ts + CANDLE_SECONDS if closed else open_ts
+        self.append_candles([[open_ts * 1000, open, 0, 0, close]], timestamp)
+        self.trim(timestamp)
+        self.save_completed(timestamp)
+
+        return True
+
+    def sum_candles(self, first_ts: int, last_ts: int) -> tuple[int, int]:
+        # Sum and number of the buffered candles opened in [first_ts, last_ts)
+        first = bisect.bisect_left(self.candle_ts, first_ts)
+        last = bisect.bisect_left(self.candle_ts, last_ts)
+        return (sum(self.candle_value[first:last]), last - first)
+
+    def sum_buckets(self, seconds: int, first_ts: int, last_ts: int) -> tuple[int, int]:
+        # Sum and number of the candles of the whole buckets in [first_ts, last_ts)
+        (total, count) = (0, 0)
+        buckets = self.buckets[seconds]
+        for start in range(first_ts, last_ts, seconds):
+            bucket = buckets.get(start)
+            if bucket is not None:
+                total += bucket[0]
+                count += bucket[1]
+        return (total, count)
+
+    def get_avg_price(self, avg_hrs: int, timestamp: int) -> float:
+        # Consider the candles opened in the (timestamp - avg_hrs, timestamp] window
+        window_start = timestamp - avg_hrs * 60 * 60
+        (fine, coarse) = BUCKET_SECONDS
+
+        # The window is split into the whole 15m buckets, as many as possible of them merged into hours,
+        # and the single candles before the first bucket and after the last one. The running candle
+        # is not aggregated yet, thus its bucket is summed candle by candle
+        last_fine = timestamp - timestamp % fine
+        if self.last_is_open:
+            last_fine = min(last_fine, self.candle_ts[-1] -
+                            self.candle_ts[-1] % fine)
+        first_fine = min(window_start - window_start % fine + fine, last_fine)
+        first_coarse = min(-(-first_fine // coarse) * coarse, last_fine)
+        last_coarse = max(last_fine - last_fine % coarse, first_coarse)
+
+        parts = [self.sum_candles(window_start + 1, first_fine),
+                 self.sum_buckets(fine, first_fine, first_coarse),
+                 self.sum_buckets(coarse, first_coarse, last_coarse),
+                 self.sum_buckets(fine, last_coarse, last_fine),
+                 self.sum_candles(last_fine, timestamp + 1)]
+        total = sum(part[0] for part in parts)
+        count = sum(part[1] for part in parts)
+
+        if count == 0:
+            raise Exception(
+                f"[ERR] No buffered candles for {self.coin_name} in the last {avg_hrs} hours")
+
+        # Exact integer sum, rounded only once by the division as in the 1m method of get_avg_price
+        result = total / (2 * PRICE_SCALE * count)
+
+        return truncate(result, 9)
+
+    def save_completed(self, timestamp: int):
+        # Write the buffer every time a 15m bucket is completed
+        bucket = timestamp - timestamp % BUCKET_SECONDS[0]
+        if bucket > self.saved_bucket:
+            self.saved_bucket = bucket
+            self.save()
+
+    def save(self):
+        if self.path is None or not self.is_seeded():
+            return
+
+        # Only the closed candles, the running one is downloaded again at restart
+        count = len(self.candle_ts) - (1 if self.last_is_open else 0)
+        content = {"version": CANDLES_VERSION, "coin": self.coin_name,
+                   "candles": [self.candle_ts[:count], self.candle_value[:count]],
+                   "buckets": {str(seconds): [[start] + bucket for start, bucket in buckets.items()]
+                               for seconds, buckets in self.buckets.items()}}
+
+        # Write a temporary file and replace the old one, a crash never leaves a partial file
+        with open(self.path + ".tmp", "w") as file:
+            json.dump(content, file, separators=(",", ":"))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(self.path + ".tmp", self.path)
+
+    def load(self, timestamp: int):
+        if self.path is None or not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path) as file:
+                content = json.load(file)
+            if content["version"] != CANDLES_VERSION or content["coin"] != self.coin_name:
+                return
+
+            # The saved candles must cover the whole window, which may be grown since then
+            (candle_ts, candle_value) = content["candles"]
+            if len(candle_ts) == 0 or candle_ts[0] > timestamp - self.max_hrs * 60 * 60 + CANDLE_SECONDS:
+                return
+
+            self.clear()
+            (self.candle_ts, self.candle_value) = (candle_ts, candle_value)
+            for seconds in BUCKET_SECONDS:
+                self.buckets[seconds] = {bucket[0]: bucket[1:]
+                                         for bucket in content["buckets"][str(seconds)]}
+
+        except Exception as e:
+            # A damaged file costs only the download of the whole window
+            print(
+                f"[ERR] Unable to load the candles of {self.coin_name}: {str(e)}")
+            self.clear()
+            return
+
+        print(
+            f"[INFO] Loaded {len(self.candle_ts)} candles of {self.coin_name}, catching up from {self.candle_ts[-1] if self.is_seeded() else 0}")
+
+
+def create_candle_buffers(configs: list[UserConfiguration], folder: str = None) -> dict:
+    # Every coin needs a buffer as long as the widest average requested by its configurations
+    buffers = {}
+    for config in configs:
+        max_hrs = max(config.AVG_HRS, config.SHORT_AVG_HRS,
+                      config.LONG_AVG_HRS)
+
+        if config.COIN_NAME not in buffers:
+            path = os.path.join(folder, config.COIN_NAME +
+                                ".candles") if folder is not None else None
+            buffers[config.COIN_NAME] = CandleBuffer(
+                config.COIN_NAME, max_hrs, path)
+        else:
+            buffers[config.COIN_NAME].max_hrs = max(
+                buffers[config.COIN_NAME].max_hrs, max_hrs)
+
+    return buffers
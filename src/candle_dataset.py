@@ -0,0 +1,250 @@
+import datetime as dt
+import numpy as np
+import struct
+import json
+import mmap
+import os
+import zlib
+import csv
+
+# Binary candle dataset layout:
+#   magic, version
+#   chunks: every column of up to CHUNK_ROWS candles, raw or zlib compressed, 8 bytes aligned
+#   footer: JSON with the columns and the position and time range of every chunk
+#   footer length (uint64), magic
+# Every saved batch is written as new chunks followed by a new footer, the old footers are left in
+# place, thus an interrupted write always leaves the previous footer valid
+DATASET_MAGIC = b"CNDL"
+DATASET_VERSION = 1
+DATASET_EXTENSION = ".cndl"
+CHUNK_ROWS = 65536
+
+# One typed column for every candle field
+COLUMNS = [("timestamp", "<i8"), ("open", "<f8"), ("high", "<f8"),
+           ("low", "<f8"), ("close", "<f8"), ("volume", "<f8")]
+
+
+def parse_footer(content, footer_end: int) -> tuple[dict, int]:
+    # Footer closed by the magic ending at footer_end, None if the bytes are not a footer
+    footer_end -= len(DATASET_MAGIC) + 8
+    footer_size = struct.unpack("<Q", content[footer_end:footer_end + 8])[0]
+    footer_start = footer_end - footer_size
+    if footer_start < len(DATASET_MAGIC) + 4:
+        return (None, 0)
+
+    try:
+        footer = json.loads(content[footer_start:footer_end])
+    except ValueError:
+        return (None, 0)
+    if not isinstance(footer, dict) or "chunks" not in footer:
+        return (None, 0)
+
+    return (footer, footer_start)
+
+
+def read_footer(content) -> tuple[dict, int, int]:
+    # Verify the file and return the last complete footer with its start and end positions
+    if content[:len(DATASET_MAGIC)] != DATASET_MAGIC:
+        raise Exception("[ERR] The file is not a candle dataset")
+
+    # The footer closes the file, unless a write was interrupted: then the previous one is looked for
+    footer_end = len(content)
+    while footer_end >= 2 * len(DATASET_MAGIC) + 12:
+        if content[footer_end - len(DATASET_MAGIC):footer_end] == DATASET_MAGIC:
+            (footer, footer_start) = parse_footer(content, footer_end)
+            if footer is not None:
+                return (footer, footer_start, footer_end)
+
+        position = content.rfind(DATASET_MAGIC, len(
+            DATASET_MAGIC), footer_end - 1)
+        if position < 0:
+            break
+        footer_end = position + len(DATASET_MAGIC)
+
+    raise Exception("[ERR] The candle dataset has no valid footer")
+
+
+class DatasetWriter:
+    def __init__(self, path: str, compress: bool = True, append: bool = False):
+        # The candles are written one batch at a time, thus the whole download is never kept in memory
+        self.compress = compress
+        self.chunks = []
+        self.rows = 0
+        self.pending = []
+
+        if not append or not os.path.exists(path):
+            # An empty footer at once, thus even an interrupted first batch leaves a dataset to resume
+            self.file = open(path, "wb")
+            self.file.write(DATASET_MAGIC + struct.pack("<I", DATASET_VERSION))
+            self.write_footer()
+            return
+
+        # Keep the existing chunks and footer, the new ones are written after them
+        with open(path, "rb") as file:
+            content = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (footer, _, footer_end) = read_footer(content)
+        content.close()
+        self.compress = footer["compression"] == "zlib"
+        self.chunks = footer["chunks"]
+        self.rows = footer["rows"]
+        self.committed = len(self.chunks)
+
+        # Drop the partial write of an interrupted run
+        self.file = open(path, "r+b")
+        self.file.seek(footer_end)
+        self.file.truncate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def align(self):
+        # Keep every column aligned, so that the uncompressed ones can be mapped as typed arrays
+        padding = -self.file.tell() % 8
+        self.file.write(b"\x00" * padding)
+
+    def append(self, candles: list):
+        # Every candle is (open unix timestamp, open, high, low, close, volume), sorted by time
+        self.pending.extend(candles)
+        while len(self.pending) >= CHUNK_ROWS:
+            self.write_chunk(self.pending[:CHUNK_ROWS])
+            self.pending = self.pending[CHUNK_ROWS:]
+
+    def write_chunk(self, candles: list):
+        chunk = {"rows": len(candles), "first_ts": int(candles[0][0]),
+                 "last_ts": int(candles[-1][0]), "columns": {}}
+
+        for i in range(len(COLUMNS)):
+            (name, dtype) = COLUMNS[i]
+            content = np.asarray([candle[i] for candle in candles],
+                                 dtype=np.dtype(dtype)).tobytes()
+            if self.compress:
+                content = zlib.compress(content)
+
+            self.align()
+            chunk["columns"][name] = [self.file.tell(), len(content)]
+            self.file.write(content)
+
+        self.chunks.append(chunk)
+        self.rows += len(candles)
+
+    def write_footer(self):
+        footer = json.dumps({"rows": self.rows, "compression": "zlib" if self.compress else "none",
+                             "columns": COLUMNS, "chunks": self.chunks}).encode("utf-8")
+        self.file.write(footer)
+        self.file.write(struct.pack("<Q", len(footer)) + DATASET_MAGIC)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.committed = len(self.chunks)
+
+    def commit(self):
+        # Make the buffered candles durable: the chunks reach the disk before the footer referencing them
+        if len(self.pending) != 0:
+            self.write_chunk(self.pending)
+            self.pending = []
+        if len(self.chunks) == self.committed:
+            return
+
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.write_footer()
+
+    def close(self):
+        if self.file.closed:
+            return
+
+        self.commit()
+        self.file.close()
+
+
+def get_last_timestamp(path: str) -> int:
+    # Open time of the last candle of the dataset (0 if it is empty)
+    with open(path, "rb") as file:
+        content = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    (footer, _, _) = read_footer(content)
+    content.close()
+
+    return footer["chunks"][-1]["last_ts"] if len(footer["chunks"]) != 0 else 0
+
+
+def is_dataset_file(path: str) -> bool:
+    with open(path, "rb") as file:
+        return file.read(len(DATASET_MAGIC)) == DATASET_MAGIC
+
+
+def read_candles(path: str, start: int = None, end: int = None, columns: list[str] = None) -> dict:
+    # Map the file, the uncompressed columns are read without copying them
+    with open(path, "rb") as file:
+        content = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    (footer, _, _) = read_footer(content)
+
+    dtypes = {name: np.dtype(dtype) for name, dtype in footer["columns"]}
+    if columns is None:
+        columns = list(dtypes)
+
+    # Only the chunks overlapping the [start, end] range are read
+    chunks = [chunk for chunk in footer["chunks"]
+              if (start is None or chunk["last_ts"] >= start) and (end is None or chunk["first_ts"] <= end)]
+
+    result = {}
+    for name in set(columns) | {"timestamp"}:
+        parts = []
+        for chunk in chunks:
+            (offset, size) = chunk["columns"][name]
+            if footer["compression"] == "zlib":
+                parts.append(np.frombuffer(zlib.decompress(
+                    content[offset:offset + size]), dtype=dtypes[name]))
+            else:
+                parts.append(np.frombuffer(
+                    content, dtype=dtypes[name], count=chunk["rows"], offset=offset))
+
+        if len(parts) == 1:
+            result[name] = parts[0]
+        else:
+            result[name] = np.concatenate(parts) if len(
+                parts) != 0 else np.zeros(0, dtype=dtypes[name])
+
+    # Cut the first and last chunks to the exact range
+    first = 0 if start is None else int(
+        np.searchsorted(result["timestamp"], start, side="left"))
+    last = len(result["timestamp"]) if end is None else int(
+        np.searchsorted(result["timestamp"], end, side="right"))
+
+    return {name: result[name][first:last] for name in columns}
+
+
+def export_csv(path: str, candles: list):
+    # Same format of the data gatherer logs, written at once
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(["timestamp", "unix_date", "current_price"])
+        for candle in candles:
+            writer.writerow([candle[0], dt.datetime.fromtimestamp(
+                candle[0]), candle[1]])
+
+    print("[INFO] Created new log file: " + path)
+
+
+def read_price_log(path: str, start: int = None, end: int = None) -> tuple:
+    # The binary datasets store the whole candle, the price of the logs is the open one
+    if is_dataset_file(path):
+        candles = read_candles(path, start, end, ["timestamp", "open"])
+        return (candles["timestamp"], candles["open"])
+
+    # Open the CSV file
+    file = open(path)
+    reader = csv.DictReader(file)
+
+    # Read the content in the requested range
+    data_ts = []
+    data_price = []
+    for row in reader:
+        timestamp = int(row["timestamp"])
+        if (start is None or timestamp >= start) and (end is None or timestamp <= end):
+            data_ts.append(timestamp)
+            data_price.append(float(row["current_price"]))
+
+    file.close()
+    return (data_ts, data_price)
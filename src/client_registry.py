@@ -0,0 +1,50 @@
+from binance_interface import *
+from json_configuration_reader import *
+from rate_limiter import *
+from requests.adapters import HTTPAdapter
+import threading
+import json
+import os
+
+
+def create_client(key_file_name: str, limiter: RateLimiter, pool_size: int) -> Spot:
+    # Setup the API client
+    with open(get_absolute_path("../" + key_file_name), 'rb') as key_file:
+        key = key_file.read()
+        key = json.loads(key)
+
+    # Create the client REST object
+    client = Spot(api_key=key["APIKey"], private_key=key["privateKey"])
+
+    # Keep enough alive connections for all the workers sharing the client
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    client.session.mount("https://", adapter)
+
+    # Follow the weight counted by the server, it includes the requests of the other programs
+    client.session.hooks["response"].append(limiter.observe_response)
+
+    # Share the request budget among all the clients, each request weighted as the server does
+    return RateLimitedClient(client, limiter, REQUEST_WEIGHTS)
+
+
+class ClientRegistry:
+    def __init__(self, limiter: RateLimiter, pool_size: int):
+        self.limiter = limiter
+        self.pool_size = pool_size
+
+        # Clients and key file modification times, indexed by key file
+        self.clients = {}
+        self.mtimes = {}
+        self.lock = threading.Lock()
+
+    def get_client(self, key_file_name: str) -> Spot:
+        mtime = os.stat(get_absolute_path("../" + key_file_name)).st_mtime
+
+        # Build the client again only when the key file changed
+        with self.lock:
+            if self.mtimes.get(key_file_name) != mtime:
+                self.clients[key_file_name] = create_client(
+                    key_file_name, self.limiter, self.pool_size)
+                self.mtimes[key_file_name] = mtime
+
+            return self.clients[key_file_name]
@@ -1,51 +1,109 @@
 from binance_interface import *
 from json_configuration_reader import *
-from logger import *
+from candle_dataset import *
+from rate_limiter import *
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 import datetime as dt
 import time
 import json
 import argparse
 
+# A max of 1000 candles can be requested
+PAGE_CANDLES = 1000
 
-class LoggedData(LoggableObject):
-    timestamp = 0
-    unix_date = 0
-    current_price = 0.0
+# Pages downloaded together, their candles are saved before starting the next ones
+BATCH_PAGES = 64
+DOWNLOAD_WORKERS = 8
 
+# Binance allows 6000 request weight per minute, use half of it
+MAX_WEIGHT_PER_SECOND = 50
+MAX_WEIGHT_BURST = 100
 
-def gather_data(client: Spot, coin_name: str, starting_timestamp: int, simulation_days: int):
-    # A max of 1000 samples can be requested
-    current_time = starting_timestamp
-    delta_seconds = 1000 * 60
-    iterations = int(simulation_days * 24.0 * 60.0 / 1000.0)
+# Attempts for every page, waiting RETRY_DELAY * 2^attempt seconds (or what the server asks) in between
+MAX_RETRIES = 5
+RETRY_DELAY = 1
 
-    data_collection_ts = []
-    data_collection_dates = []
-    data_collection_price = []
 
-    counter = 0
-    while counter < iterations:
+def fetch_page(client: Spot, coin_name: str, page_start: int, page_end: int) -> list:
+    for attempt in range(MAX_RETRIES):
         try:
-            print(
-                f"[INFO] Data gathering: {(100.0 * counter / iterations):.2f}%")
-            # Retrieve the data candles
-            data = client.klines(coin_name, "1m", startTime=(
-                current_time - (iterations - counter) * delta_seconds) * 1000, limit=1000)
-
-            # Pack them from top to bottom (the candles are sorted such that the most recent time is the first element)
-            for i in range(len(data)):
-                candle = data[i]
-                data_collection_ts.append(candle[0] // 1000)
-                data_collection_dates.append(
-                    dt.datetime.fromtimestamp(candle[0] // 1000))
-                data_collection_price.append(candle[1])
-
-            counter += 1
+            data = client.klines(coin_name, "1m", startTime=page_start * 1000,
+                                 endTime=page_end * 1000, limit=PAGE_CANDLES)
+
+            # Keep only the candles inside the page, as (open unix timestamp, open, high, low, close, volume)
+            return [(candle[0] // 1000, candle[1], candle[2], candle[3], candle[4], candle[5])
+                    for candle in data if page_start <= candle[0] // 1000 <= page_end]
+
         except Exception as e:
-            print(f"[ERR] Error retrieving simulation data: {str(e)}")
-            time.sleep(1)
+            print(
+                f"[ERR] Error retrieving the candles from {dt.datetime.fromtimestamp(page_start)}: {str(e)}")
+
+            # When the request limit is exceeded the server tells how long to wait
+            delay = RETRY_DELAY * pow(2, attempt)
+            header = getattr(e, "header", None)
+            if getattr(e, "status_code", None) in [418, 429] and header is not None and "Retry-After" in header:
+                delay = max(delay, int(header["Retry-After"]))
+            time.sleep(delay)
+
+    raise Exception(
+        f"[ERR] Unable to retrieve the candles from {dt.datetime.fromtimestamp(page_start)}")
+
+
+def find_gaps(timestamps: list, first: int, last: int) -> list[tuple[int, int]]:
+    # Ranges [start, end] of the minutes missing between first and last (included)
+    gaps = []
+    previous = first - 60
+    for timestamp in timestamps + [last + 60]:
+        if timestamp - previous > 60:
+            gaps.append((previous + 60, timestamp - 60))
+        previous = timestamp
+
+    return gaps
+
+
+def create_pages(first: int, last: int) -> list[tuple[int, int]]:
+    # Pages [start, end] of at most PAGE_CANDLES minutes, never overlapping
+    return [(start, min(start + (PAGE_CANDLES - 1) * 60, last)) for start in range(first, last + 1, PAGE_CANDLES * 60)]
+
+
+def gather_data(client: Spot, coin_name: str, starting_timestamp: int, ending_timestamp: int, save, executor: ThreadPoolExecutor) -> int:
+    # Candles opened from starting_timestamp to ending_timestamp (included), aligned to the minute
+    pages = create_pages(starting_timestamp, ending_timestamp)
+    saved = 0
+
+    for i in range(0, len(pages), BATCH_PAGES):
+        print(
+            f"[INFO] Data gathering: {(100.0 * i / len(pages)):.2f}%")
+        batch = pages[i:i + BATCH_PAGES]
+        (first, last) = (batch[0][0], batch[-1][1])
 
-    return (data_collection_ts, data_collection_dates, data_collection_price)
+        # Download the pages concurrently, the candles are deduplicated by open time
+        candles = {}
+        for data in executor.map(lambda page: fetch_page(client, coin_name, page[0], page[1]), batch):
+            for candle in data:
+                candles[candle[0]] = candle
+
+        # Request the missing minutes once again, the remaining ones are real holes of the exchange data
+        gaps = find_gaps(sorted(candles), first, last)
+        if len(gaps) != 0:
+            retry = [page for (start, end) in gaps for page in create_pages(start, end)]
+            for data in executor.map(lambda page: fetch_page(client, coin_name, page[0], page[1]), retry):
+                for candle in data:
+                    candles[candle[0]] = candle
+
+            for (start, end) in find_gaps(sorted(candles), first, last):
+                print(
+                    f"[INFO] Missing candles from {dt.datetime.fromtimestamp(start)} to {dt.datetime.fromtimestamp(end)}")
+
+        # Save the batch before downloading the next one. The binary dataset commits every batch with its
+        # own footer, thus a killed download keeps the saved batches and --append resumes after them.
+        # The CSV log is instead written only at the end
+        save([candles[timestamp] for timestamp in sorted(candles)])
+        saved += len(candles)
+
+    print("[INFO] Data gathering: 100.00%")
+    return saved
 
 
 def main():
@@ -56,6 +114,18 @@ def main():
         "-c", "--coin", help="the Binance coin name (E.g. BTCUSDT)", required=True)
     parser.add_argument(
         "-d", "--days", default=30, help="how many days the program must download (Default: 30)")
+    parser.add_argument("-f", "--format", default="cndl", choices=["cndl", "csv"],
+                        help="the output format: the binary candle dataset with the whole candles or the CSV log with the open prices (Default: cndl)")
+    parser.add_argument("--no-compress", action="store_true",
+                        help="store the binary dataset uncompressed, bigger but read without copies")
+    parser.add_argument(
+        "-o", "--output", default=None, help="the output file (Default: ../COIN-DAYS.cndl or ../COIN-DAYS.csv)")
+    parser.add_argument("-a", "--append", action="store_true",
+                        help="extend the existing binary dataset from its last candle up to now, also resumes an interrupted download")
+    parser.add_argument(
+        "-w", "--workers", default=DOWNLOAD_WORKERS, help=f"how many pages are downloaded concurrently (Default: {DOWNLOAD_WORKERS})")
+    parser.add_argument(
+        "--base-url", default="https://api.binance.com", help="the binance REST API endpoint (Default: https://api.binance.com)")
 
     # Parse the input data from user
     args = parser.parse_args()
@@ -63,34 +133,66 @@ def main():
     SIMULATION_DAYS = int(args.days)
     COIN_NAME = args.coin
     KEY_FILE_NAME = "key.json"
+    WORKERS = int(args.workers)
+
+    if args.append and args.format != "cndl":
+        raise Exception("[ERR] Only the binary datasets can be extended")
+
+    file_name = args.output
+    if file_name is None:
+        file_name = get_absolute_path("../" + COIN_NAME + "-" + str(SIMULATION_DAYS) +
+                                      (DATASET_EXTENSION if args.format == "cndl" else ".csv"))
 
     # Load the key
     with open(get_absolute_path("../" + KEY_FILE_NAME), 'rb') as key_file:
         key = key_file.read()
     key = json.loads(key)
 
-    # Setup the API client
-    client = Spot(api_key=key["APIKey"], private_key=key["privateKey"])
-
-    # Set the starting timestamp as the current one
-    starting_timestamp = get_server_timestamp(client)
-
-    # Gather the data from the server
-    (data_ts, data_dates, data_prices) = gather_data(
-        client, COIN_NAME, starting_timestamp, SIMULATION_DAYS)
-
-    # Save the data into file
-    for i in range(len(data_ts)):
-        print(f"[INFO] Saving data: {(100.0 * i / len(data_ts)):.2f}%")
-
-        data = LoggedData()
-        data.timestamp = data_ts[i]
-        data.unix_date = data_dates[i]
-        data.current_price = data_prices[i]
-
-        # Log the data into the file
-        log_data(get_absolute_path("../" + COIN_NAME +
-                 "-" + str(SIMULATION_DAYS) + ".csv"), data)
+    # Setup the API client, with a connection for every worker and the requests weighted as the server does
+    client = Spot(api_key=key["APIKey"],
+                  private_key=key["privateKey"], base_url=args.base_url)
+    client.session.mount("https://", HTTPAdapter(
+        pool_connections=1, pool_maxsize=WORKERS))
+    client.session.mount("http://", HTTPAdapter(
+        pool_connections=1, pool_maxsize=WORKERS))
+    limiter = RateLimiter(MAX_WEIGHT_PER_SECOND, MAX_WEIGHT_BURST)
+    client.session.hooks["response"].append(limiter.observe_response)
+    client = RateLimitedClient(client, limiter, REQUEST_WEIGHTS)
+
+    # Only the closed candles are downloaded
+    ending_timestamp = (get_server_timestamp(client) // 60) * 60 - 60
+    starting_timestamp = ending_timestamp - SIMULATION_DAYS * 24 * 60 * 60 + 60
+
+    # Continue from the last candle of the existing dataset
+    if args.append and os.path.exists(file_name):
+        last_timestamp = get_last_timestamp(file_name)
+        if last_timestamp != 0:
+            starting_timestamp = last_timestamp + 60
+        print(
+            f"[INFO] Extending {file_name} from {dt.datetime.fromtimestamp(starting_timestamp)}")
+
+    if starting_timestamp > ending_timestamp:
+        print("[INFO] The dataset is already up to date")
+        return
+
+    with ThreadPoolExecutor(WORKERS) as executor:
+        if args.format == "csv":
+            # The CSV log is written at once
+            candles = []
+            gather_data(client, COIN_NAME, starting_timestamp,
+                        ending_timestamp, candles.extend, executor)
+            export_csv(file_name, candles)
+        else:
+            # The dataset is extended batch by batch
+            with DatasetWriter(file_name, not args.no_compress, args.append) as writer:
+                def save(candles: list):
+                    writer.append([(candle[0], float(candle[1]), float(candle[2]), float(candle[3]),
+                                  float(candle[4]), float(candle[5])) for candle in candles])
+                    writer.commit()
+
+                count = gather_data(client, COIN_NAME, starting_timestamp,
+                                    ending_timestamp, save, executor)
+            print(f"[INFO] Saved {count} candles into {file_name}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,108 @@
+from binance_interface import *
+import threading
+import time
+
+# Seconds after which the cached exchange filters are downloaded again
+EXCHANGE_INFO_TTL = 60 * 60
+
+# Seconds after which the coins that could not be downloaded are asked again
+EXCHANGE_INFO_RETRY = 5 * 60
+
+# Seconds after which the local clock is aligned again to the server one
+CLOCK_SYNC_PERIOD = 10 * 60
+
+
+class SymbolInfo:
+    def __init__(self, filters: list):
+        self.filters = filters
+
+        # Number of decimals accepted for the order quantity
+        self.lot_increment = get_lot_increment(filters)
+
+        # Number of decimals accepted for the order price
+        self.price_increment = 8
+        for filter in filters:
+            if filter["filterType"] == "PRICE_FILTER":
+                self.price_increment = get_increment_from_string(
+                    filter["tickSize"])
+                break
+
+
+class ExchangeCache:
+    def __init__(self, coin_names: list[str], ttl: int = EXCHANGE_INFO_TTL):
+        self.coin_names = list(dict.fromkeys(coin_names))
+        self.ttl = ttl
+        self.symbols = {}
+        self.last_refresh = 0
+        self.expiry = ttl
+        self.lock = threading.Lock()
+
+        # Coins that the last download could not get, not looked for again until the next refresh
+        self.unknown = set()
+
+    def refresh(self, client: Spot):
+        # A single bulk request for all the configured coins. The exchange refuses the whole request
+        # when a single symbol is invalid (E.g. a delisted coin), then every coin is asked on its own
+        try:
+            filters = get_symbols_filters(client, self.coin_names)
+        except Exception as e:
+            print(
+                f"[ERR] Unable to download the exchange information of all the coins, asking them one by one: {str(e)}")
+            filters = {}
+            for coin_name in self.coin_names:
+                try:
+                    filters.update(get_symbols_filters(client, [coin_name]))
+                except Exception as e:
+                    print(
+                        f"[ERR] Unable to download the exchange information of {coin_name}: {str(e)}")
+
+        # The coins that failed keep their cached filters, if any, and are asked again sooner
+        for coin_name, coin_filters in filters.items():
+            self.symbols[coin_name] = SymbolInfo(coin_filters)
+        self.unknown = set(self.coin_names) - set(filters)
+        self.last_refresh = time.monotonic()
+        self.expiry = self.ttl if len(self.unknown) == 0 else min(
+            self.ttl, EXCHANGE_INFO_RETRY)
+
+    def get_symbol(self, client: Spot, coin_name: str) -> SymbolInfo:
+        # Download again the filters once they expired, or once if the coin is unknown
+        with self.lock:
+            if time.monotonic() - self.last_refresh > self.expiry or \
+                    (coin_name not in self.symbols and coin_name not in self.unknown):
+                self.refresh(client)
+
+            if coin_name not in self.symbols:
+                self.unknown.add(coin_name)
+                raise Exception(
+                    f"[ERR] The exchange information does not list {coin_name}")
+
+            return self.symbols[coin_name]
+
+
+class ServerClock:
+    def __init__(self, sync_period: int = CLOCK_SYNC_PERIOD):
+        self.sync_period = sync_period
+
+        # Difference in seconds between the server clock and the local one
+        self.offset = 0.0
+        self.last_sync = None
+        self.lock = threading.Lock()
+
+    def sync(self, client: Spot):
+        # Estimate the offset assuming the server answered at half of the round trip
+        request_time = time.time()
+        data = client.time()
+        response_time = time.time()
+
+        self.offset = int(data["serverTime"]) / 1000 - \
+            (request_time + response_time) / 2
+        self.last_sync = time.monotonic()
+
+    def get_timestamp(self, client: Spot) -> int:
+        # Align the clocks only once in a while, otherwise rely on the local one
+        with self.lock:
+            if self.last_sync is None or time.monotonic() - self.last_sync > self.sync_period:
+                self.sync(client)
+
+        # Unix time in seconds as returned by get_server_timestamp
+        return int(time.time() + self.offset)
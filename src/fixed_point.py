@@ -0,0 +1,15 @@
+import numpy as np
+
+# The prices have at most 8 decimals, thus price * PRICE_SCALE is an exact integer. The sums of such
+# integers do not depend on the order of the additions, so every method averaging the same prices
+# (E.g. candle by candle or through pre-aggregated buckets) gets the very same result
+PRICE_SCALE = 10 ** 8
+
+
+def to_fixed_point(price) -> int:
+    return round(float(price) * PRICE_SCALE)
+
+
+def to_fixed_point_array(prices) -> np.ndarray:
+    # Same rounding (half to even) of to_fixed_point, for a whole array
+    return np.rint(np.asarray(prices, dtype=np.float64) * PRICE_SCALE).astype(np.int64)
@@ -0,0 +1,372 @@
+from automatic_invester import *
+from candle_dataset import *
+from logger import *
+import numpy as np
+import threading
+import shutil
+import time
+import argparse
+
+# Amount of every base currency owned by each replayed account at the beginning
+REPLAY_BALANCE = 100
+
+# Fee applied by the replayed exchange to every fill (0.1%, as the binance spot one)
+REPLAY_FEE = 0.001
+
+# Filters of every replayed symbol, the quantities are sent with 8 decimals at most
+REPLAY_STEP_SIZE = "0.00000001"
+REPLAY_TICK_SIZE = "0.00000001"
+
+# Folder of the console log, the execution logs and the internal states of the replays
+REPLAY_FOLDER = "../replay"
+
+# Duration of a single 1m candle in seconds
+CANDLE_SECONDS = 60
+
+
+class ReplayFinished(BaseException):
+    # As KeyboardInterrupt, it passes through the error handling of the invester and stops it
+    pass
+
+
+class VirtualClock:
+    def __init__(self, start: float, end: float):
+        # Unix time of the replay, it moves forward only when the program sleeps
+        self.now = float(start)
+        self.end = end
+        self.lock = threading.Lock()
+
+        # Time read last by every thread, the sleeps computed from it start there
+        self.local = threading.local()
+
+    def time(self) -> float:
+        now = self.now
+        self.local.read = now
+        return now
+
+    def sleep(self, seconds: float):
+        # Jump to the wake up time instead of waiting for it. The threads waiting together (E.g. in the
+        # rate limiter) computed their delays from the same time, thus the clock moves to the latest
+        # wake up time instead of their sum. The replay ends after the last candle
+        with self.lock:
+            wake = getattr(self.local, "read", self.now) + max(0, seconds)
+            self.now = max(self.now, wake)
+            self.local.read = wake
+            if self.now > self.end:
+                raise ReplayFinished()
+
+    def __enter__(self):
+        # Every module reads the time through the time module, thus the live code runs unchanged.
+        # The perf_counter is left untouched, so the metrics measure the real cost of the ticks
+        self.original = (time.time, time.monotonic, time.sleep)
+        (time.time, time.monotonic, time.sleep) = (
+            self.time, self.time, self.sleep)
+        return self
+
+    def __exit__(self, *_):
+        (time.time, time.monotonic, time.sleep) = self.original
+
+
+def read_market_data(path: str) -> dict:
+    # The binary datasets store the whole candles
+    if is_dataset_file(path):
+        return read_candles(path, columns=["timestamp", "open", "close"])
+
+    # The CSV logs store the open prices only, every candle closes at the open of the next one
+    (data_ts, data_price) = read_price_log(path)
+    data_price = np.asarray(data_price, dtype=np.float64)
+    return {"timestamp": np.asarray(data_ts, dtype=np.int64), "open": data_price,
+            "close": np.append(data_price[1:], data_price[-1:])}
+
+
+class ReplayExchange:
+    def __init__(self, clock: VirtualClock, markets: dict, balances: dict, fee: float = REPLAY_FEE):
+        # Candles indexed by symbol, with the traded currency and the base currency of the symbol
+        self.clock = clock
+        self.markets = markets
+        self.balances = dict(balances)
+        self.fee = fee
+
+        # Filled orders, the balances are shared among the workers
+        self.orders = []
+        self.lock = threading.Lock()
+
+    def get_market(self, symbol: str) -> dict:
+        if symbol not in self.markets:
+            raise Exception(f"[ERR] No replay data for {symbol}")
+        return self.markets[symbol]
+
+    def get_price(self, symbol: str) -> float:
+        # The running candle is known up to its open price, the last one is kept after a gap
+        market = self.get_market(symbol)
+        now = self.clock.time()
+        index = int(np.searchsorted(
+            market["timestamp"], now, side="right")) - 1
+        if index < 0:
+            raise Exception(
+                f"[ERR] The replay data for {symbol} starts after {int(now)}")
+
+        if now < market["timestamp"][index] + CANDLE_SECONDS:
+            return float(market["open"][index])
+        return float(market["close"][index])
+
+    def time(self) -> dict:
+        return {"serverTime": int(self.clock.time() * 1000)}
+
+    def ticker_price(self, symbol: str) -> dict:
+        return {"symbol": symbol, "price": f"{self.get_price(symbol):.8f}"}
+
+    def klines(self, symbol: str, interval: str, startTime: int = None, endTime: int = None, limit: int = 500) -> list:
+        if interval != "1m":
+            raise Exception(
+                f"[ERR] The replay serves only 1m candles, not {interval}")
+
+        # Only the candles opened until now, the future ones are not known yet
+        market = self.get_market(symbol)
+        data_ts = market["timestamp"]
+        now = self.clock.time()
+        end = min(now, endTime / 1000) if endTime is not None else now
+        first = int(np.searchsorted(data_ts, startTime / 1000, side="left")
+                    ) if startTime is not None else 0
+        last = int(np.searchsorted(data_ts, end, side="right"))
+
+        # As binance, the first candles from the start or the last ones before the end
+        if startTime is not None:
+            last = min(last, first + limit)
+        else:
+            first = max(first, last - limit)
+
+        candles = []
+        for i in range(first, last):
+            (open, close) = (float(market["open"][i]),
+                             float(market["close"][i]))
+
+            # The running candle closes at the current price
+            if now < data_ts[i] + CANDLE_SECONDS:
+                close = open
+
+            candles.append([int(data_ts[i]) * 1000, f"{open:.8f}", f"{max(open, close):.8f}", f"{min(open, close):.8f}",
+                            f"{close:.8f}", "0", (int(data_ts[i]) + CANDLE_SECONDS) * 1000 - 1])
+        return candles
+
+    def account(self) -> dict:
+        with self.lock:
+            return {"balances": [{"asset": asset, "free": f"{amount:.8f}", "locked": "0.00000000"}
+                                 for asset, amount in self.balances.items()]}
+
+    def exchange_info(self, symbol: str = None, symbols: list = None) -> dict:
+        symbols = symbols if symbols is not None else [symbol]
+        return {"symbols": [{"symbol": name, "filters": [{"filterType": "LOT_SIZE", "stepSize": REPLAY_STEP_SIZE},
+                                                         {"filterType": "PRICE_FILTER", "tickSize": REPLAY_TICK_SIZE}]}
+                            for name in symbols]}
+
+    def new_order(self, symbol: str, side: str, type: str, quantity: str = None, quoteOrderQty: float = None, **kwargs) -> dict:
+        if type != "MARKET":
+            raise Exception(
+                f"[ERR] The replay fills only MARKET orders, not {type}")
+
+        market = self.get_market(symbol)
+        price = self.get_price(symbol)
+        (currency, base_currency) = (
+            market["currency"], market["base_currency"])
+
+        # Fill the whole order at the current price, paying the fee with the received asset. As binance,
+        # the balances have 8 decimals, thus the whole free amount can always be sold
+        with self.lock:
+            if side == "BUY":
+                spent = float(quoteOrderQty)
+                bought = spent / price
+                if spent > self.balances.get(base_currency, 0):
+                    raise Exception(
+                        f"[ERR] Insufficient {base_currency} balance to buy {symbol}")
+                self.balances[base_currency] = round(
+                    self.balances[base_currency] - spent, 8)
+                self.balances[currency] = round(self.balances.get(
+                    currency, 0) + truncate(bought * (1 - self.fee), 8), 8)
+                (executed, quote) = (bought, spent)
+            else:
+                sold = float(quantity)
+                if sold > self.balances.get(currency, 0):
+                    raise Exception(
+                        f"[ERR] Insufficient {currency} balance to sell {symbol}")
+                self.balances[currency] = round(
+                    self.balances[currency] - sold, 8)
+                self.balances[base_currency] = round(self.balances.get(
+                    base_currency, 0) + truncate(sold * price * (1 - self.fee), 8), 8)
+                (executed, quote) = (sold, sold * price)
+
+            order = {"symbol": symbol, "orderId": len(self.orders) + 1, "transactTime": int(self.clock.time() * 1000),
+                     "side": side, "type": type, "status": "FILLED", "price": f"{price:.8f}",
+                     "executedQty": f"{executed:.8f}", "cummulativeQuoteQty": f"{quote:.8f}"}
+            self.orders.append(order)
+
+        return order
+
+
+class ReplayRegistry:
+    def __init__(self, exchanges: dict, limiter: RateLimiter):
+        # Every key file is a different replayed account, behind the same budget of the live clients
+        self.clients = {key_file_name: RateLimitedClient(exchange, limiter, REQUEST_WEIGHTS)
+                        for key_file_name, exchange in exchanges.items()}
+
+    def get_client(self, key_file_name: str):
+        return self.clients[key_file_name]
+
+
+def check_averages(configs: list[UserConfiguration], client: ReplayExchange, clock: VirtualClock, period: int) -> tuple[int, int]:
+    # Compare at every tick the averages of the candle buffers with the 1m method, which downloads the
+    # whole windows again. They must be identical, not only close
+    requests = gather_market_requests(configs)
+    candle_buffers = create_candle_buffers(configs)
+    (checks, mismatches) = (0, 0)
+    try:
+        while True:
+            timestamp = int(clock.time())
+            for coin_name, windows in requests.items():
+                candle_buffers[coin_name].update(client, timestamp)
+                for avg_hrs in sorted(windows):
+                    expected = get_avg_price(
+                        client, coin_name, avg_hrs, timestamp)
+                    result = candle_buffers[coin_name].get_avg_price(
+                        avg_hrs, timestamp)
+
+                    checks += 1
+                    if result != expected:
+                        mismatches += 1
+                        print(
+                            f"[ERR] Average of {avg_hrs} hours of {coin_name} at {timestamp}: {result} instead of {expected}")
+            clock.sleep(period)
+    except ReplayFinished:
+        pass
+
+    return (checks, mismatches)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="A program that runs the automatic invester on the recorded market data, against a local exchange and a virtual clock")
+    parser.add_argument("-d", "--data", action="append", required=True,
+                        help="the market data of a coin, as COIN=PATH of a binary dataset or a CSV log of the data gatherer (E.g. BTCUSDT=../BTCUSDT-30.cndl), repeated for every coin")
+    parser.add_argument("-c", "--config", default="../invester_config.json",
+                        help="the invester configuration, its orders are always filled by the replayed exchange (Default: ../invester_config.json)")
+    parser.add_argument("-o", "--output", default=REPLAY_FOLDER,
+                        help=f"the folder of the console log, the execution logs and the internal states (Default: {REPLAY_FOLDER})")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="delete the files of a previous replay in the output folder, otherwise the replay refuses to start")
+    parser.add_argument("-b", "--balance", default=REPLAY_BALANCE,
+                        help=f"the amount of every base currency owned at the beginning (Default: {REPLAY_BALANCE})")
+    parser.add_argument("--fee", default=REPLAY_FEE,
+                        help=f"the fee applied to every fill (Default: {REPLAY_FEE})")
+    parser.add_argument("-p", "--period", default=UPDATE_PERIOD, choices=[str(period) for period in TICK_PERIODS],
+                        help=f"the seconds between two updates (Default: {UPDATE_PERIOD})")
+    parser.add_argument("-w", "--weight-budget", default=MAX_WEIGHT_PER_MINUTE,
+                        help=f"max request weight used in a virtual minute (Default: {MAX_WEIGHT_PER_MINUTE})")
+    parser.add_argument("--from", dest="start", default=None,
+                        help="the first replayed time, as unix timestamp, date or time before now (E.g. 1700000000, 2024-01-31, -7d) (Default: once the widest average is covered)")
+    parser.add_argument("--to", dest="end", default=None,
+                        help="the last replayed time, in the same formats (Default: the end of the data)")
+    parser.add_argument("--check-averages", action="store_true",
+                        help="instead of running the invester, check at every tick that the averages of the candle buffers are identical to the 1m method ones")
+
+    # Parse the input data from user
+    args = parser.parse_args()
+
+    configs = read_user_configurations(args.config)
+    for config in configs:
+        # The orders move only the balances of the replayed accounts
+        config.TEST_MODE = False
+
+    # Load the candles of every configured coin
+    markets = {}
+    for data in args.data:
+        (coin_name, path) = data.split("=", 1)
+        markets[coin_name] = read_market_data(get_absolute_path(path))
+    for config in configs:
+        if config.COIN_NAME not in markets:
+            raise Exception(f"[ERR] No replay data for {config.COIN_NAME}")
+        markets[config.COIN_NAME]["currency"] = config.CURRENCY_NAME
+        markets[config.COIN_NAME]["base_currency"] = config.BASE_CURRENCY_NAME
+
+    # By default, start as soon as every average can be computed and stop at the last candle
+    max_hrs = max(max(config.AVG_HRS, config.SHORT_AVG_HRS,
+                  config.LONG_AVG_HRS) for config in configs)
+    start = parse_log_time(args.start)
+    if start is None:
+        start = max(int(markets[config.COIN_NAME]["timestamp"][0])
+                    for config in configs) + max_hrs * 60 * 60
+    end = parse_log_time(args.end)
+    if end is None:
+        end = min(int(markets[config.COIN_NAME]["timestamp"][-1])
+                  for config in configs) + CANDLE_SECONDS
+
+    # Every key file is a different account, all of them start with the same balances
+    clock = VirtualClock(start, end)
+    balances = {config.BASE_CURRENCY_NAME: float(
+        args.balance) for config in configs}
+    exchanges = {config.KEY_FILE_NAME: ReplayExchange(
+        clock, markets, balances, float(args.fee)) for config in configs}
+
+    # The check only reads the candles, nothing is written
+    if args.check_averages:
+        (checks, mismatches) = check_averages(configs, ReplayExchange(
+            clock, markets, balances), clock, int(args.period))
+        print(
+            f"[INFO] {checks} averages checked against the 1m method, {mismatches} different")
+        if mismatches != 0:
+            raise Exception(
+                f"[ERR] {mismatches} averages of the candle buffers differ from the 1m method")
+        return
+
+    # Write everything apart from the live invester. The states and the candles of a previous replay
+    # belong to another time, thus every replay starts from scratch
+    set_output_folder(args.output)
+    for folder in ["execution_logs", "internal_states"]:
+        path = get_output_path(folder)
+        if os.path.exists(path) and len(os.listdir(path)) != 0:
+            if not args.overwrite:
+                raise Exception(
+                    f"[ERR] The output folder {get_output_path('')} contains a previous replay, use --overwrite to delete it")
+            shutil.rmtree(path)
+        os.makedirs(path, exist_ok=True)
+    if os.path.exists(get_output_path("console.log")):
+        os.remove(get_output_path("console.log"))
+
+    print(
+        f"[INFO] Replaying from {dt.datetime.fromtimestamp(start)} to {dt.datetime.fromtimestamp(end)} into {get_output_path('')}")
+
+    console = sys.stdout
+    real_start = time.perf_counter()
+    with clock:
+        # The same budget and loop of the live invester, on the virtual time
+        limiter = RateLimiter(int(args.weight_budget) / 60,
+                              MAX_WEIGHT_BURST, ORDER_WEIGHT_RESERVE)
+        registry = ReplayRegistry(exchanges, limiter)
+
+        new_stdout = open(get_output_path("console.log"), "a")
+        sys.stdout = new_stdout
+        try:
+            run_invester(configs, registry, limiter, int(args.period))
+        except ReplayFinished:
+            pass
+        finally:
+            sys.stdout = console
+            new_stdout.close()
+
+            # Write the buffered rows and the final metrics before leaving the virtual time
+            flush_logs()
+            METRICS.write(get_output_path(METRICS_FILE))
+    elapsed = time.perf_counter() - real_start
+
+    # Overhead of the live loop, measured on the real time
+    ticks = METRICS.get_histogram("tick_seconds")
+    count = ticks.count if ticks is not None else 0
+    print(f"[INFO] Replayed {(end - start) / (24 * 60 * 60):.1f} days in {elapsed:.1f} seconds ({(end - start) / max(elapsed, 1e-9):.0f}x)")
+    print(f"[INFO] {count} ticks, {ticks.sum / count * 1000 if count != 0 else 0:.3f} ms per tick on average")
+
+    for key_file_name, exchange in exchanges.items():
+        print(f"[INFO] {key_file_name}: {len(exchange.orders)} orders, final balances " +
+              ", ".join(f"{asset} {amount:.8f}" for asset, amount in exchange.balances.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+from logger import *
+import matplotlib.dates as mdates
+import datetime as dt
+import numpy as np
+import gzip
+
+# Columns read as text, all the others are numbers
+TEXT_COLUMNS = ["last_action"]
+
+# Points drawn for every horizontal pixel: the minimum and the maximum of its bucket
+POINTS_PER_PIXEL = 2
+
+
+def read_log_columns(path: str, columns: list[str], start: int = None, end: int = None) -> dict:
+    # Parse only the needed columns of every segment, straight into typed arrays
+    names = ["timestamp"] + columns
+    dtype = [(name, "U32" if name in TEXT_COLUMNS else "i8" if name == "timestamp" else "f8")
+             for name in names]
+
+    parts = []
+    for segment in get_log_segments(path, start, end):
+        opener = gzip.open if segment.endswith(".gz") else open
+        with opener(segment, "rt", newline="") as file:
+            header = file.readline().strip().split(",")
+            data = np.loadtxt(file, delimiter=",", dtype=dtype, ndmin=1,
+                              usecols=[header.index(name) for name in names])
+
+        mask = np.ones(len(data), dtype=bool)
+        if start is not None:
+            mask &= data["timestamp"] >= start
+        if end is not None:
+            mask &= data["timestamp"] <= end
+        parts.append(data[mask])
+
+    data = np.concatenate(parts) if len(parts) != 0 else np.zeros(0, dtype=dtype)
+    return {name: data[name] for name in names}
+
+
+def get_plot_dates(data_ts: np.ndarray) -> np.ndarray:
+    # Matplotlib dates of the unix timestamps, shown in local time by the axis
+    return mdates.date2num(data_ts.astype("datetime64[s]"))
+
+
+def downsample(x: np.ndarray, y: np.ndarray, buckets: int) -> tuple[np.ndarray, np.ndarray]:
+    # Keep the minimum and the maximum of every bucket, in their order, thus the spikes survive
+    if len(x) <= buckets * POINTS_PER_PIXEL:
+        return (x, y)
+
+    size = int(np.ceil(len(y) / buckets))
+    padded = np.full(size * buckets, np.nan)
+    padded[:len(y)] = y
+    padded = padded.reshape(buckets, size)
+
+    # The missing values (E.g. no sell threshold) are picked only by empty buckets, leaving a gap
+    offsets = np.arange(buckets) * size
+    minimums = offsets + np.argmin(np.where(np.isnan(padded), np.inf, padded), axis=1)
+    maximums = offsets + np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis=1)
+
+    indexes = np.unique(np.concatenate([minimums, maximums]))
+    indexes = indexes[indexes < len(y)]
+    return (x[indexes], y[indexes])
+
+
+class DownsampledPlot:
+    def __init__(self, ax):
+        # Lines redrawn with the visible points only, every time the zoom changes
+        self.ax = ax
+        self.lines = []
+        ax.xaxis_date(dt.datetime.now().astimezone().tzinfo)
+        ax.callbacks.connect("xlim_changed", lambda _: self.update())
+
+    def plot(self, x: np.ndarray, y: np.ndarray, **kwargs):
+        (line,) = self.ax.plot([], [], **kwargs)
+        self.lines.append((line, x, y))
+
+    def action_lines(self, x: np.ndarray, data_action: np.ndarray):
+        # Vertical lines where the action changes, all of the same kind drawn at once
+        changes = np.flatnonzero(data_action[1:] != data_action[:-1]) + 1
+        buys = changes[np.char.find(data_action[changes], "BUY") >= 0]
+        sells = changes[np.char.find(data_action[changes], "SELL") >= 0]
+
+        transform = self.ax.get_xaxis_transform()
+        self.ax.vlines(x[buys], 0, 1, transform=transform, color="b", label="BUY")
+        self.ax.vlines(x[sells], 0, 1, transform=transform, color="g", label="SELL")
+
+    def reset_view(self):
+        # Start from the whole range, with the vertical limits of the whole data
+        x = np.concatenate([line[1] for line in self.lines])
+        y = np.concatenate([line[2] for line in self.lines])
+        if len(x) != 0:
+            self.ax.set_ylim(np.nanmin(y), np.nanmax(y))
+            self.ax.set_xlim(x.min(), x.max())
+
+    def update(self):
+        (minimum, maximum) = self.ax.get_xlim()
+        buckets = max(1, int(self.ax.bbox.width))
+
+        for (line, x, y) in self.lines:
+            # One more point on each side, thus the line reaches the borders
+            first = max(0, int(np.searchsorted(x, minimum)) - 1)
+            last = min(len(x), int(np.searchsorted(x, maximum)) + 1)
+            line.set_data(*downsample(x[first:last], y[first:last], buckets))
+
+        self.ax.figure.canvas.draw_idle()
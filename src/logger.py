@@ -1,50 +1,232 @@
+import datetime as dt
+import threading
+import shutil
+import atexit
+import gzip
+import time
+import csv
 import os
 
+# The rows are kept in memory until FLUSH_SIZE bytes are buffered or FLUSH_PERIOD seconds are elapsed
+FLUSH_SIZE = 64 * 1024
+FLUSH_PERIOD = 30
 
-class LoggableObject:
-    def getCSVString(self) -> str:
-        result = ""
+# The rotating logs are compressed into a segment once they reach ROTATE_SIZE bytes or ROTATE_PERIOD seconds
+ROTATE_SIZE = 16 * 1024 * 1024
+ROTATE_PERIOD = 24 * 60 * 60
+
+# Every rotating log has an index with the time range of each segment: <log>.idx
+INDEX_EXTENSION = ".idx"
 
+# Fields of every loggable class, discovered once
+SCHEMAS = {}
+
+
+def get_schema(cls) -> list[str]:
+    schema = SCHEMAS.get(cls)
+    if schema is None:
         # Gather all the possible attributes of the polymorphism class
-        variables = vars(self.__class__)
-        for var in variables:
-            if not callable(getattr(self, var)) and not var.startswith("__"):
-                # Add the field into the result
-                content = vars(self)
-                result += str(content[str(var)]) + ","
+        schema = [var for var, value in vars(cls).items()
+                  if not callable(value) and not var.startswith("__")]
+        SCHEMAS[cls] = schema
+
+    return schema
 
-        # Exclude the last coma
-        result = result[0: len(result) - 1]
-        result += "\n"
 
-        return result
+class LoggableObject:
+    def getCSVRow(self) -> list:
+        return [getattr(self, var) for var in get_schema(self.__class__)]
+
+    def getCSVString(self) -> str:
+        return ",".join([str(value) for value in self.getCSVRow()]) + "\n"
 
     def getCSVHeader(self) -> str:
-        result = ""
+        return ",".join(get_schema(self.__class__)) + "\n"
 
-        # Gather all the possible attributes of the polymorphism class
-        variables = vars(self.__class__)
-        for var in variables:
-            if not callable(getattr(self, var)) and not var.startswith("__"):
-                # Add the field into the result
-                result += str(var) + ","
 
-        # Exclude the last coma
-        result = result[0: len(result) - 1]
-        result += "\n"
+def read_log_range(path: str) -> tuple[int, int]:
+    # Timestamps of the first and the last rows, reading only the beginning and the end of the file
+    with open(path, "rb") as file:
+        lines = file.read(4096).split(b"\n")
+        if len(lines) < 3:
+            return (None, None)
+        first = int(lines[1].split(b",")[0])
+
+        file.seek(max(0, os.stat(path).st_size - 4096))
+        lines = [line for line in file.read().split(b"\n") if line != b""]
+        last = int(lines[-1].split(b",")[0])
+
+    return (first, last)
+
+
+class LogFile:
+    def __init__(self, path: str, flush_size: int, rotate: bool = False):
+        self.path = path
+        self.flush_size = flush_size
+        self.rotate = rotate
+        self.open()
+
+    def open(self):
+        # Long lived handle, the buffer is written to disk once full
+        self.file = open(self.path, "a", newline="", buffering=self.flush_size)
+        self.writer = csv.writer(self, lineterminator="\n")
+
+        # Check if file is empty
+        self.size = os.stat(self.path).st_size
+        self.empty = self.size == 0
+
+        # Time range of the rows, needed by the rotation
+        (self.first_ts, self.last_ts) = (None, None)
+        if self.rotate and not self.empty:
+            (self.first_ts, self.last_ts) = read_log_range(self.path)
+
+    def write(self, object):
+        # Rows of the csv writer
+        if isinstance(object, str):
+            self.size += len(object)
+            self.file.write(object)
+            return
+
+        # Rotate before the row which would exceed the size or the period
+        timestamp = getattr(object, "timestamp", None)
+        if self.rotate and self.first_ts is not None and timestamp is not None and \
+                (self.size >= ROTATE_SIZE or timestamp - self.first_ts >= ROTATE_PERIOD):
+            self.rotate_file()
+
+        if self.empty:
+            # Write the header
+            self.writer.writerow(get_schema(object.__class__))
+            self.empty = False
+            print("[INFO] Created new log file: " + self.path)
+
+        self.writer.writerow(object.getCSVRow())
+
+        if timestamp is not None:
+            if self.first_ts is None:
+                self.first_ts = timestamp
+            self.last_ts = timestamp
+
+    def rotate_file(self):
+        self.file.close()
+
+        # Compress the rows into a segment named after its first timestamp
+        segment = f"{self.path}.{self.first_ts}.gz"
+        with open(self.path, "rb") as source, gzip.open(segment + ".tmp", "wb") as destination:
+            shutil.copyfileobj(source, destination)
+        os.replace(segment + ".tmp", segment)
+
+        # Register the segment, then start a new log
+        index = self.path + INDEX_EXTENSION
+        with open(index, "a") as file:
+            if os.stat(index).st_size == 0:
+                file.write("segment,first_ts,last_ts\n")
+            file.write(
+                f"{os.path.basename(segment)},{self.first_ts},{self.last_ts}\n")
+        open(self.path, "w").close()
+
+        print(f"[INFO] Rotated log file: {self.path} into {segment}")
+        self.open()
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class LogManager:
+    def __init__(self, flush_size: int = FLUSH_SIZE, flush_period: float = FLUSH_PERIOD):
+        self.flush_size = flush_size
+        self.flush_period = flush_period
+
+        # Open files indexed by path, shared among all the threads
+        self.files = {}
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+    def log(self, path: str, object: LoggableObject, flush: bool = False, rotate: bool = False):
+        with self.lock:
+            # Open the file and, if necessary create it
+            log_file = self.files.get(path)
+            if log_file is None:
+                log_file = LogFile(path, self.flush_size, rotate)
+                self.files[path] = log_file
+
+            log_file.write(object)
+
+            # The important rows are written immediately, the others periodically
+            if flush:
+                log_file.flush()
+            if time.monotonic() - self.last_flush >= self.flush_period:
+                self.flush_all()
+
+    def flush_all(self):
+        for log_file in self.files.values():
+            log_file.flush()
+        self.last_flush = time.monotonic()
+
+    def flush(self):
+        with self.lock:
+            self.flush_all()
+
+    def close(self):
+        with self.lock:
+            for log_file in self.files.values():
+                log_file.close()
+            self.files = {}
+
+
+# Logger shared by the whole program, the buffers are written at exit
+LOG_MANAGER = LogManager()
+atexit.register(LOG_MANAGER.close)
+
+
+def log_data(path: str, object: LoggableObject, flush: bool = False, rotate: bool = False):
+    LOG_MANAGER.log(path, object, flush, rotate)
+
+
+def flush_logs():
+    LOG_MANAGER.flush()
+
+
+def get_log_segments(path: str, start: int = None, end: int = None) -> list[str]:
+    # Files of a rotating log with rows in the [start, end] range, from the oldest one
+    segments = []
+    index = path + INDEX_EXTENSION
+    if os.path.exists(index):
+        with open(index) as file:
+            for row in csv.DictReader(file):
+                if (start is None or int(row["last_ts"]) >= start) and (end is None or int(row["first_ts"]) <= end):
+                    segments.append(os.path.join(
+                        os.path.dirname(path), row["segment"]))
+
+    # The current log is read only if it overlaps the range
+    if os.path.exists(path) and os.stat(path).st_size != 0:
+        (first, last) = read_log_range(path)
+        if first is not None and (start is None or last >= start) and (end is None or first <= end):
+            segments.append(path)
 
-        return result
+    return segments
 
 
-def log_data(path: str, object: LoggableObject):
-    # Open the file and, if necessary create it
-    file = open(path, "a")
+def read_log_rows(path: str, start: int = None, end: int = None):
+    # Rows of a rotating log in the [start, end] range, opening only the needed segments
+    for segment in get_log_segments(path, start, end):
+        opener = gzip.open if segment.endswith(".gz") else open
+        with opener(segment, "rt", newline="") as file:
+            for row in csv.DictReader(file):
+                timestamp = int(row["timestamp"])
+                if (start is None or timestamp >= start) and (end is None or timestamp <= end):
+                    yield row
 
-    # Check if file is empty
-    if os.stat(path).st_size == 0:
-        # Write the header
-        file.write(object.getCSVHeader())
-        print("[INFO] Created new log file: " + path)
 
-    file.write(object.getCSVString())
-    file.close()
+def parse_log_time(value: str) -> int:
+    # Unix timestamp, date (E.g. 2024-01-31 or 2024-01-31T12:00) or time before now (E.g. -24h, -7d)
+    if value is None:
+        return None
+    if value.startswith("-") and value[-1] in "smhd":
+        units = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+        return int(time.time() - float(value[1:-1]) * units[value[-1]])
+    if value.isdigit():
+        return int(value)
+    return int(dt.datetime.fromisoformat(value).timestamp())
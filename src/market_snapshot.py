@@ -0,0 +1,77 @@
+from binance_interface import *
+from json_configuration_reader import *
+from candle_buffer import *
+from exchange_cache import *
+from concurrent.futures import Executor
+
+
+class MarketSnapshot:
+    def __init__(self, timestamp: int):
+        self.timestamp = timestamp
+
+        # Current price for every coin
+        self.prices = {}
+
+        # Average price for every (coin, hours) couple
+        self.averages = {}
+
+        # Error message for every coin whose data could not be gathered
+        self.errors = {}
+
+    def get_price(self, coin_name: str) -> float:
+        self.check(coin_name)
+        return self.prices[coin_name]
+
+    def get_avg_price(self, coin_name: str, avg_hrs: int) -> float:
+        self.check(coin_name)
+        return self.averages[(coin_name, avg_hrs)]
+
+    def check(self, coin_name: str):
+        # Propagate the error so that every configuration on the same coin reports it
+        if coin_name in self.errors:
+            raise Exception(
+                f"[ERR] Market data for {coin_name} not available: {self.errors[coin_name]}")
+
+
+def gather_market_requests(configs: list[UserConfiguration]) -> dict:
+    # Collect the distinct averaging windows requested for every coin
+    requests = {}
+    for config in configs:
+        windows = requests.setdefault(config.COIN_NAME, set())
+        windows.add(config.AVG_HRS)
+
+        # The long/short averages are needed only when both are configured
+        if config.LONG_AVG_HRS != 0 and config.SHORT_AVG_HRS != 0:
+            windows.add(config.LONG_AVG_HRS)
+            windows.add(config.SHORT_AVG_HRS)
+
+    return requests
+
+
+def take_market_snapshot(client: Spot, requests: dict, candle_buffers: dict, clock: ServerClock, executor: Executor = None) -> MarketSnapshot:
+    # A single server timestamp is shared by all the configurations
+    snapshot = MarketSnapshot(clock.get_timestamp(client))
+
+    def fetch_coin(coin_name: str):
+        windows = requests[coin_name]
+        try:
+            snapshot.prices[coin_name] = get_current_price(client, coin_name)
+
+            # Extend the candle buffer and answer all the windows from it
+            candle_buffer = candle_buffers[coin_name]
+            candle_buffer.update(client, snapshot.timestamp)
+            for avg_hrs in windows:
+                snapshot.averages[(coin_name, avg_hrs)] = candle_buffer.get_avg_price(
+                    avg_hrs, snapshot.timestamp)
+
+        except Exception as e:
+            snapshot.errors[coin_name] = str(e)
+
+    # Fetch every coin exactly once, in parallel when an executor is available
+    if executor is None:
+        for coin_name in requests:
+            fetch_coin(coin_name)
+    else:
+        list(executor.map(fetch_coin, requests))
+
+    return snapshot
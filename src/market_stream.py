@@ -0,0 +1,199 @@
+from binance.websocket.spot.websocket_stream import SpotWebsocketStreamClient
+from candle_buffer import *
+from market_snapshot import *
+from investment_strategy import *
+import threading
+import copy
+import json
+
+# Default binance market stream endpoint
+STREAM_URL = "wss://stream.binance.com:9443"
+
+
+class MarketStream:
+    def __init__(self, coin_names: list[str], candle_buffers: dict, stream_url: str = STREAM_URL):
+        self.coin_names = list(dict.fromkeys(coin_names))
+        self.candle_buffers = candle_buffers
+        self.stream_url = stream_url
+        self.client = None
+
+        # Last traded price for every coin and time of the most recent event (unix seconds)
+        self.prices = {}
+        self.event_ts = 0
+
+        # Price band for every coin, leaving it may change a decision
+        self.thresholds = {}
+
+        # Coins whose candle buffer lost some candles and must be filled through the REST API
+        self.stale_coins = set(self.coin_names)
+
+        # Candles received for every coin under refill, applied once the REST API filled its buffer
+        self.refilling = {}
+
+        # Protect the buffers shared with the stream thread and wake up the decision loop
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.connected = False
+
+    def connect(self):
+        # Stop the previous connection, otherwise its threads stay alive
+        self.stop()
+
+        # The candles received while disconnected are lost
+        with self.lock:
+            self.stale_coins = set(self.coin_names)
+
+        self.client = SpotWebsocketStreamClient(stream_url=self.stream_url, on_message=self.on_message,
+                                                on_close=self.on_close, on_error=self.on_error, is_combined=True)
+        self.connected = True
+
+        # Subscribe to the closed candles and to the trades of every coin
+        streams = []
+        for coin_name in self.coin_names:
+            streams.append(coin_name.lower() + "@kline_1m")
+            streams.append(coin_name.lower() + "@trade")
+        self.client.subscribe(streams)
+
+    def stop(self):
+        if self.client is not None:
+            try:
+                self.client.stop()
+            except Exception as e:
+                print(f"[ERR] Unable to stop the market stream: {str(e)}")
+            self.client = None
+        self.connected = False
+
+    def on_close(self, _):
+        self.connected = False
+        self.event.set()
+
+    def on_error(self, _, error):
+        print(f"[ERR] Market stream error: {str(error)}")
+        self.connected = False
+        self.event.set()
+
+    def on_message(self, _, message: str):
+        message = json.loads(message)
+
+        # Skip the subscription replies
+        if "data" not in message:
+            return
+
+        data = message["data"]
+        coin_name = data["s"]
+
+        with self.lock:
+            self.event_ts = max(self.event_ts, data["E"] // 1000)
+
+            if data["e"] == "kline":
+                kline = data["k"]
+                self.prices[coin_name] = truncate(float(kline["c"]), 8)
+
+                # Keep the running candle in the buffer as the klines API does, unless the buffer is
+                # being filled through the REST API: then the candle waits for the refill
+                candle = (kline["t"] // 1000, float(kline["o"]),
+                          float(kline["c"]), kline["x"])
+                if coin_name in self.refilling:
+                    self.refilling[coin_name].append(candle)
+                elif not self.candle_buffers[coin_name].push_candle(*candle):
+                    self.stale_coins.add(coin_name)
+
+                # A closed candle moves the averages, thus a new decision is needed
+                if kline["x"]:
+                    self.event.set()
+
+            elif data["e"] == "trade":
+                price = truncate(float(data["p"]), 8)
+                self.prices[coin_name] = price
+
+                # Wake up the decision loop only if the price left the band
+                if coin_name in self.thresholds:
+                    (lower, upper) = self.thresholds[coin_name]
+                    if price <= lower or price >= upper:
+                        self.event.set()
+
+    def set_thresholds(self, configs: list[UserConfiguration], states: dict):
+        thresholds = {}
+
+        for config in configs:
+            state = states[config.LOG_NAME]
+            (lower, upper) = thresholds.get(
+                config.COIN_NAME, (0, float("inf")))
+
+            # Price under which a BUY is possible
+            if state.last_action != Action.BUY:
+                lower = max(lower, state.considered_avg - state.considered_avg *
+                            ((config.BUY_TAX + config.SELL_TAX + config.MIN_DELTA) / 100.0))
+            # Price over which a threshold SELL is possible (the other sells move with the averages)
+            elif config.ALGORITHM_TYPE == AlgorithmType.THRESHOLD and state.last_buy_price != 0:
+                upper = min(upper, state.last_buy_price /
+                            (1 - config.MIN_GAIN / 100.0))
+
+            thresholds[config.COIN_NAME] = (lower, upper)
+
+        with self.lock:
+            self.thresholds = thresholds
+
+    def wait(self, timeout: float):
+        # Sleep until a candle closes, a threshold is crossed or the timeout expires
+        self.event.wait(timeout)
+        self.event.clear()
+
+
+def take_stream_snapshot(client: Spot, stream: MarketStream, requests: dict, clock: ServerClock) -> MarketSnapshot:
+    # Copy the buffers with missing candles, the stream keeps receiving the new ones meanwhile
+    with stream.lock:
+        timestamp = stream.event_ts
+        refills = {}
+        for coin_name in requests:
+            if coin_name in stream.stale_coins or coin_name not in stream.prices:
+                refills[coin_name] = copy.deepcopy(
+                    stream.candle_buffers[coin_name])
+                stream.refilling[coin_name] = []
+                stream.stale_coins.discard(coin_name)
+
+                # The stream price is old, a trade received during the refill replaces the REST one
+                stream.prices.pop(coin_name, None)
+
+    # Fill the copies through the REST API without blocking the stream thread
+    if timestamp == 0:
+        timestamp = clock.get_timestamp(client)
+    prices = {}
+    errors = {}
+    for coin_name, candle_buffer in refills.items():
+        try:
+            candle_buffer.update(client, timestamp)
+            prices[coin_name] = get_current_price(client, coin_name)
+        except Exception as e:
+            errors[coin_name] = str(e)
+
+    with stream.lock:
+        # Replace the buffers with the filled copies and apply the candles received meanwhile
+        for coin_name, candle_buffer in refills.items():
+            candles = stream.refilling.pop(coin_name)
+            if coin_name in errors:
+                stream.stale_coins.add(coin_name)
+                continue
+
+            stream.candle_buffers[coin_name] = candle_buffer
+            for candle in candles:
+                if not candle_buffer.push_candle(*candle):
+                    stream.stale_coins.add(coin_name)
+            stream.prices.setdefault(coin_name, prices[coin_name])
+
+        # The decision time is the one of the most recent market event
+        snapshot = MarketSnapshot(max(timestamp, stream.event_ts))
+        for coin_name, windows in requests.items():
+            try:
+                if coin_name in errors:
+                    raise Exception(errors[coin_name])
+
+                snapshot.prices[coin_name] = stream.prices[coin_name]
+                for avg_hrs in windows:
+                    snapshot.averages[(coin_name, avg_hrs)] = stream.candle_buffers[coin_name].get_avg_price(
+                        avg_hrs, snapshot.timestamp)
+
+            except Exception as e:
+                snapshot.errors[coin_name] = str(e)
+
+    return snapshot
@@ -0,0 +1,170 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import threading
+import bisect
+import time
+import os
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+# Upper bounds (seconds) of the price age histogram buckets
+AGE_BUCKETS = [1, 2, 5, 10, 20, 30, 60, 120, 300]
+
+# Prefix of every exported metric
+METRICS_PREFIX = "invester_"
+
+# The metrics file (inside the invester output folder) is rewritten at most once every METRICS_PERIOD seconds
+METRICS_FILE = "execution_logs/metrics.prom"
+METRICS_PERIOD = 60
+
+# Interface of the metrics server, the metrics name the configurations thus only local scrapers see them
+METRICS_HOST = "127.0.0.1"
+
+
+class Histogram:
+    def __init__(self, buckets: list[float]):
+        # Samples per bucket (not cumulative), the last one counts the values over every bound
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: tuple) -> str:
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in labels) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        # Metrics indexed by name and sorted labels, shared among all the threads
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+        self.last_write = time.monotonic()
+
+    def observe(self, name: str, value: float, buckets: list[float] = LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = Histogram(buckets)
+                self.histograms[key] = histogram
+            histogram.observe(value)
+
+    def increment(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    def get_histogram(self, name: str, **labels) -> Histogram:
+        with self.lock:
+            return self.histograms.get((name, tuple(sorted(labels.items()))))
+
+    def timer(self, name: str, **labels):
+        return MetricsTimer(self, name, labels)
+
+    def export(self) -> str:
+        # Prometheus text format, the metrics of the same name are kept together
+        lines = []
+        with self.lock:
+            for kind, metrics in [("counter", self.counters), ("gauge", self.gauges)]:
+                for name in sorted({key[0] for key in metrics}):
+                    lines.append(f"# TYPE {METRICS_PREFIX}{name} {kind}")
+                    for key in sorted(key for key in metrics if key[0] == name):
+                        lines.append(
+                            f"{METRICS_PREFIX}{name}{format_labels(key[1])} {metrics[key]}")
+
+            for name in sorted({key[0] for key in self.histograms}):
+                lines.append(f"# TYPE {METRICS_PREFIX}{name} histogram")
+                for key in sorted(key for key in self.histograms if key[0] == name):
+                    histogram = self.histograms[key]
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ["+Inf"], histogram.counts):
+                        cumulative += count
+                        labels = format_labels(key[1] + (("le", bound),))
+                        lines.append(
+                            f"{METRICS_PREFIX}{name}_bucket{labels} {cumulative}")
+                    lines.append(
+                        f"{METRICS_PREFIX}{name}_sum{format_labels(key[1])} {histogram.sum}")
+                    lines.append(
+                        f"{METRICS_PREFIX}{name}_count{format_labels(key[1])} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        # Replace the file at once, thus a reader never sees it half written
+        with open(path + ".tmp", "w") as file:
+            file.write(self.export())
+        os.replace(path + ".tmp", path)
+        self.last_write = time.monotonic()
+
+    def write_periodically(self, path: str, period: float = METRICS_PERIOD):
+        if time.monotonic() - self.last_write >= period:
+            self.write(path)
+
+
+class MetricsTimer:
+    def __init__(self, registry: MetricsRegistry, name: str, labels: dict):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        # Failed calls are timed as well and counted apart, the exception is not handled
+        self.registry.observe(self.name + "_seconds",
+                              time.perf_counter() - self.start, **self.labels)
+        if exception_type is not None:
+            self.registry.increment(self.name + "_errors_total", **self.labels)
+        return False
+
+
+def serve_metrics(registry: MetricsRegistry, port: int, host: str = METRICS_HOST) -> ThreadingHTTPServer:
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+
+            content = registry.export().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            # The scrapes are not worth a line of the console log
+            pass
+
+    # Answer the scrapes from a background thread
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"[INFO] Serving the metrics on http://{host}:{port}/metrics")
+    return server
+
+
+# Metrics shared by the whole program
+METRICS = MetricsRegistry()
@@ -0,0 +1,138 @@
+from metrics import *
+import threading
+import time
+
+# Request weights of the binance API methods in use (https://developers.binance.com/docs/binance-spot-api-docs/rest-api)
+REQUEST_WEIGHTS = {"klines": 2, "ticker_price": 2, "time": 1, "account": 20,
+                   "exchange_info": 20, "new_order": 1}
+
+# Methods served before all the others, the market data can always wait
+PRIORITY_METHODS = ["new_order"]
+
+# Header with the weight used in the current minute by all the clients sharing the IP
+USED_WEIGHT_HEADER = "X-MBX-USED-WEIGHT-1M"
+
+# Seconds between two checks of a request waiting for the priority ones
+PRIORITY_POLL = 0.05
+
+
+class RateLimiter:
+    def __init__(self, requests_per_second: float, burst: int, reserve: int = 0):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+
+        # Tokens that only the priority requests can use
+        self.reserve = min(reserve, burst - 1)
+
+        # Token bucket shared among all the threads
+        self.tokens = float(burst)
+        self.last_update = time.monotonic()
+        self.lock = threading.Lock()
+
+        # Priority requests waiting for tokens, the others wait for them to pass
+        self.waiting_priority = 0
+
+        # Monotonic time until which no request is sent (E.g. after a 429 response)
+        self.paused_until = 0.0
+
+        # Total weight consumed, used to measure the cost of a tick
+        self.consumed = 0
+
+    def acquire(self, weight: int = 1, priority: bool = False):
+        # The heavier requests consume more tokens (never more than the bucket they can use)
+        weight = min(weight, self.burst - (0 if priority else self.reserve))
+
+        with self.lock:
+            if priority:
+                self.waiting_priority += 1
+
+        try:
+            while True:
+                with self.lock:
+                    # Refill the bucket depending on the elapsed time
+                    now = time.monotonic()
+                    self.tokens = min(self.burst, self.tokens +
+                                      (now - self.last_update) * self.requests_per_second)
+                    self.last_update = now
+
+                    # The other requests leave the reserve to the priority ones
+                    available = self.tokens - (0 if priority else self.reserve)
+                    ready = priority or self.waiting_priority == 0
+
+                    if now >= self.paused_until and available >= weight and ready:
+                        self.tokens -= weight
+                        self.consumed += weight
+                        return
+
+                    # Time needed for enough tokens to be available
+                    wait = max(self.paused_until - now,
+                               (weight - available) / self.requests_per_second)
+                    if not ready:
+                        wait = max(wait, PRIORITY_POLL)
+
+                time.sleep(wait)
+        finally:
+            if priority:
+                with self.lock:
+                    self.waiting_priority -= 1
+
+    def pause(self, seconds: float):
+        # Stop every request, E.g. when the server asks to back off
+        with self.lock:
+            self.paused_until = max(
+                self.paused_until, time.monotonic() + seconds)
+
+    def observe_used_weight(self, used: int):
+        # The server counts also the requests of the other programs on the same IP, thus never allow
+        # more than what is left of the budget of its current minute
+        remaining = self.requests_per_second * 60 - used
+        if remaining <= 0:
+            print(
+                f"[INFO] Request weight budget exhausted ({used} used), waiting for the next minute")
+            self.pause(60 - time.time() % 60)
+            return
+
+        with self.lock:
+            self.tokens = min(self.tokens, remaining)
+
+    def observe_response(self, response, *args, **kwargs):
+        # Hook of the requests session, called for every response
+        used = response.headers.get(USED_WEIGHT_HEADER)
+        if used is not None:
+            self.observe_used_weight(int(used))
+
+        # Too many requests (429) or banned IP (418): wait as long as the server asks
+        if response.status_code in [418, 429]:
+            retry_after = response.headers.get("Retry-After")
+            self.pause(int(retry_after) if retry_after is not None else 60)
+
+
+class RateLimitedClient:
+    def __init__(self, client, limiter: RateLimiter, weights: dict = None):
+        self.client = client
+        self.limiter = limiter
+
+        # Request weight of every API method, 1 when missing
+        self.weights = weights if weights is not None else {}
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.client, name)
+
+        # Only the API methods consume the request budget
+        if not callable(attribute):
+            return attribute
+
+        weight = self.weights.get(name, 1)
+        priority = name in PRIORITY_METHODS
+
+        def limited_call(*args, **kwargs):
+            # Time spent waiting for the budget and answering, for every endpoint
+            start = time.perf_counter()
+            self.limiter.acquire(weight, priority)
+            METRICS.observe("binance_wait_seconds",
+                            time.perf_counter() - start, endpoint=name)
+
+            with METRICS.timer("binance_request", endpoint=name):
+                return attribute(*args, **kwargs)
+
+        return limited_call
@@ -0,0 +1,94 @@
+from json_configuration_reader import *
+import numpy as np
+import sqlite3
+import hashlib
+import json
+import copy
+
+# Default location and size of the cache, the least recently used scores are evicted first
+CACHE_FILE = "../score_cache.db"
+CACHE_MAX_ENTRIES = 1000000
+
+# Change it every time the simulation changes its results, the old scores are then ignored
+CACHE_VERSION = 1
+
+# Fields of the configuration which change the result of a simulation
+SIMULATION_FIELDS = ["ALGORITHM_TYPE", "AVG_HRS", "SHORT_AVG_HRS", "LONG_AVG_HRS", "MIN_GAIN",
+                     "BUY_TAX", "SELL_TAX", "MIN_DELTA", "STOP_LOSS", "SLEEP_DAYS_AFTER_LOSS"]
+
+
+def get_dataset_fingerprint(data_ts, data_price) -> str:
+    # Hash of the typed content, thus independent from the file format
+    digest = hashlib.sha256()
+    digest.update(np.asarray(data_ts, dtype=np.int64).tobytes())
+    digest.update(np.asarray(data_price, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+class ScoreCache:
+    def __init__(self, path: str, fingerprint: str, config: UserConfiguration, max_entries: int = CACHE_MAX_ENTRIES):
+        # The configuration holds the values of the fields which are not searched
+        self.fingerprint = fingerprint
+        self.config = config
+        self.max_entries = max_entries
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, score REAL, used INTEGER)")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS scores_used ON scores (used)")
+
+        # Counter of the accesses, used to evict the least recently used scores
+        self.clock = self.connection.execute(
+            "SELECT COALESCE(MAX(used), 0) FROM scores").fetchone()[0]
+
+    def get_key(self, names: list[str], point: tuple, fraction: float) -> str:
+        point_config = copy.copy(self.config)
+        for name, value in zip(names, point):
+            setattr(point_config, name, value)
+
+        # Normalize the values, such that 1, 1.0 and 1.00000000000001 have the same key
+        fields = {}
+        for field in SIMULATION_FIELDS:
+            value = getattr(point_config, field)
+            if isinstance(value, AlgorithmType):
+                fields[field] = str(value.value)
+            else:
+                fields[field] = repr(round(float(value), 9))
+
+        content = json.dumps([CACHE_VERSION, self.fingerprint,
+                             repr(round(fraction, 9)), fields], sort_keys=True)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def get(self, keys: list[str]) -> dict:
+        scores = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            scores.update(self.connection.execute(
+                f"SELECT key, score FROM scores WHERE key IN ({marks})", chunk).fetchall())
+
+        # Refresh the found scores
+        self.clock += 1
+        self.connection.executemany("UPDATE scores SET used = ? WHERE key = ?", [
+                                    (self.clock, key) for key in scores])
+        self.connection.commit()
+
+        return scores
+
+    def put(self, scores: dict):
+        self.clock += 1
+        self.connection.executemany("INSERT OR REPLACE INTO scores (key, score, used) VALUES (?, ?, ?)", [
+                                    (key, score, self.clock) for key, score in scores.items()])
+
+        # Evict the least recently used scores in excess
+        count = self.connection.execute(
+            "SELECT COUNT(*) FROM scores").fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute("DELETE FROM scores WHERE key IN (SELECT key FROM scores ORDER BY used LIMIT ?)",
+                                    (count - self.max_entries,))
+
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
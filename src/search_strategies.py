@@ -0,0 +1,214 @@
+import itertools
+import decimal
+import random
+import math
+
+
+class Parameter:
+    def __init__(self, name: str, minimum: float, maximum: float, step: float):
+        # Name of the UserConfiguration field and its values, from minimum (included) to maximum (excluded)
+        self.name = name
+        digits = max(0, -decimal.Decimal(str(step)).as_tuple().exponent)
+        count = math.ceil((maximum - minimum) / step - 1e-9)
+        self.values = [round(minimum + i * step, digits) if digits != 0 else minimum + i * step
+                       for i in range(max(1, count))]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class SearchSpace:
+    def __init__(self, parameters: list[Parameter], constraint=None):
+        # A point is the tuple of the values of every parameter, the constraint rejects the invalid ones
+        self.parameters = parameters
+        self.constraint = constraint
+
+    def get_names(self) -> list[str]:
+        return [parameter.name for parameter in self.parameters]
+
+    def get_size(self) -> int:
+        # Number of points, invalid ones included
+        return math.prod([len(parameter) for parameter in self.parameters])
+
+    def is_valid(self, point: tuple) -> bool:
+        return self.constraint is None or self.constraint(dict(zip(self.get_names(), point)))
+
+    def grid(self, stride: int = 1) -> list[tuple]:
+        # Every stride-th value of every parameter, the last value is always included
+        axes = []
+        for parameter in self.parameters:
+            indexes = list(range(0, len(parameter), stride))
+            if indexes[-1] != len(parameter) - 1:
+                indexes.append(len(parameter) - 1)
+            axes.append([parameter.values[i] for i in indexes])
+
+        return [point for point in itertools.product(*axes) if self.is_valid(point)]
+
+    def sample(self, count: int, generator: random.Random) -> list[tuple]:
+        # Small spaces are enumerated, the rejections would be too many
+        if count * 4 >= self.get_size():
+            points = self.grid()
+            if count >= len(points):
+                return points
+            return sorted(generator.sample(points, count))
+
+        # Distinct random valid points, give up after too many rejections
+        points = set()
+        attempts = 0
+        while len(points) < count and attempts < count * 100:
+            point = tuple(generator.choice(parameter.values)
+                          for parameter in self.parameters)
+            if self.is_valid(point):
+                points.add(point)
+            attempts += 1
+
+        return sorted(points)
+
+    def neighbours(self, point: tuple, distance: int) -> list[tuple]:
+        # Valid points moved by -distance, 0 or +distance values along every parameter
+        axes = []
+        for parameter, value in zip(self.parameters, point):
+            index = parameter.values.index(value)
+            axes.append([parameter.values[i] for i in sorted({max(0, index - distance), index,
+                                                               min(len(parameter) - 1, index + distance)})])
+
+        return [neighbour for neighbour in itertools.product(*axes) if neighbour != point and self.is_valid(neighbour)]
+
+
+class GridSearch:
+    def search(self, space: SearchSpace, evaluate) -> list[tuple]:
+        # Evaluate every valid point on the whole data
+        points = space.grid()
+        return list(zip(points, evaluate(points, 1.0)))
+
+
+class RandomSearch:
+    def __init__(self, budget: int, seed: int = None):
+        # The budget is the number of simulations on the whole data
+        self.budget = budget
+        self.generator = random.Random(seed)
+
+    def search(self, space: SearchSpace, evaluate) -> list[tuple]:
+        points = space.sample(self.budget, self.generator)
+        return list(zip(points, evaluate(points, 1.0)))
+
+
+class CoarseToFineSearch:
+    def __init__(self, budget: int, stride: int = 4, keep: int = 4, seed: int = None):
+        # Start from a grid with a value every stride ones and refine around the keep best points
+        self.budget = budget
+        self.stride = stride
+        self.keep = keep
+        self.generator = random.Random(seed)
+
+    def search(self, space: SearchSpace, evaluate) -> list[tuple]:
+        scores = {}
+
+        # Coarse grid, randomly reduced if it does not fit the budget
+        points = space.grid(self.stride)
+        if len(points) > self.budget:
+            points = sorted(self.generator.sample(points, self.budget))
+        scores.update(zip(points, evaluate(points, 1.0)))
+
+        # Halve the distance until the neighbours of the best points stop improving
+        distance = self.stride
+        while len(scores) < self.budget:
+            distance = max(1, distance // 2)
+            best = sorted(scores, key=lambda point: scores[point],
+                          reverse=True)[:self.keep]
+
+            points = []
+            for point in best:
+                for neighbour in space.neighbours(point, distance):
+                    if neighbour not in scores and neighbour not in points:
+                        points.append(neighbour)
+            points = points[:self.budget - len(scores)]
+
+            if len(points) == 0:
+                if distance == 1:
+                    break
+                continue
+
+            best_score = scores[best[0]]
+            scores.update(zip(points, evaluate(points, 1.0)))
+
+            # At the finest level keep climbing only while the best point improves
+            if distance == 1 and max(scores.values()) <= best_score:
+                break
+
+        return list(scores.items())
+
+
+class SuccessiveHalving:
+    def __init__(self, budget: int, eta: int = 3, min_fraction: float = 1 / 9, seed: int = None):
+        # Evaluate many random points on a prefix of the data, keep the best 1/eta of them and
+        # multiply the prefix by eta until the whole data is used
+        self.budget = budget
+        self.eta = eta
+        self.min_fraction = min_fraction
+        self.generator = random.Random(seed)
+
+    def search(self, space: SearchSpace, evaluate) -> list[tuple]:
+        # Every round costs as much as count simulations on the smallest prefix
+        rounds = 1 + round(math.log(1 / self.min_fraction, self.eta))
+        count = max(1, int(self.budget / (self.min_fraction * rounds)))
+        points = space.sample(count, self.generator)
+
+        fraction = self.min_fraction
+        while True:
+            scores = evaluate(points, fraction)
+            if fraction >= 1:
+                return list(zip(points, scores))
+
+            # Only the best ones are promoted to the longer prefix
+            ranking = sorted(range(len(points)),
+                             key=lambda i: scores[i], reverse=True)
+            points = [points[i] for i in ranking[:max(
+                1, math.ceil(len(points) / self.eta))]]
+            fraction = min(1.0, fraction * self.eta)
+
+
+def create_strategy(name: str, budget: int, seed: int = None):
+    if name == "grid":
+        return GridSearch()
+    elif name == "random":
+        return RandomSearch(budget, seed)
+    elif name == "refine":
+        return CoarseToFineSearch(budget, seed=seed)
+    elif name == "halving":
+        return SuccessiveHalving(budget, seed=seed)
+
+    raise Exception(f"[ERR] Unknown search strategy {name}")
+
+
+def create_pool_evaluator(pool, processes: int, objective_batch, names: list[str], cache=None):
+    def evaluate(points: list[tuple], fraction: float) -> list[float]:
+        scores = {}
+
+        # Skip the points already simulated in the previous runs
+        keys = {}
+        if cache is not None:
+            keys = {point: cache.get_key(names, point, fraction)
+                    for point in set(points)}
+            cached = cache.get(list(keys.values()))
+            for point, key in keys.items():
+                if key in cached:
+                    scores[point] = cached[key]
+
+        # Sorted points keep together the ones sharing the same averages, so that every
+        # worker receives one contiguous batch
+        ordered = sorted(set(points) - set(scores))
+        size = max(1, math.ceil(len(ordered) / processes))
+        tasks = [(names, ordered[i:i + size], fraction)
+                 for i in range(0, len(ordered), size)]
+
+        for results in pool.imap_unordered(objective_batch, tasks):
+            scores.update(results)
+
+            # Store the scores as soon as they arrive
+            if cache is not None:
+                cache.put({keys[point]: score for point, score in results})
+
+        return [scores[point] for point in points]
+
+    return evaluate
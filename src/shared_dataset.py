@@ -0,0 +1,53 @@
+from multiprocessing import shared_memory
+from time_series import *
+import numpy as np
+
+
+class SharedDataset:
+    def __init__(self, memory: shared_memory.SharedMemory, count: int):
+        self.memory = memory
+        self.count = count
+
+        # Layout of the block: timestamps (int64), prices (float64) and their fixed point prefix sum (int64, count + 1)
+        self.timestamps = np.ndarray(
+            (count,), dtype=np.int64, buffer=memory.buf, offset=0)
+        self.prices = np.ndarray(
+            (count,), dtype=np.float64, buffer=memory.buf, offset=count * 8)
+        self.prefix_sum = np.ndarray(
+            (count + 1,), dtype=np.int64, buffer=memory.buf, offset=count * 16)
+
+    def get_series(self, count: int = None) -> TimeSeries:
+        # The series reads directly from the shared block, optionally only its first count samples
+        if count is None:
+            count = self.count
+        return TimeSeries(self.timestamps[:count], self.prices[:count], self.prefix_sum[:count + 1])
+
+    def close(self):
+        # Release the views before closing the block, otherwise the buffer cannot be released
+        self.timestamps = None
+        self.prices = None
+        self.prefix_sum = None
+        self.memory.close()
+
+    def unlink(self):
+        # Only the process which created the block destroys it
+        self.memory.unlink()
+
+
+def create_shared_dataset(data_ts: list, data_price: list) -> SharedDataset:
+    count = len(data_ts)
+    memory = shared_memory.SharedMemory(create=True, size=max(1, (3 * count + 1) * 8))
+    dataset = SharedDataset(memory, count)
+
+    dataset.timestamps[:] = data_ts
+    dataset.prices[:] = data_price
+
+    # Same prefix sum of TimeSeries
+    compute_prefix_sum(dataset.prices, dataset.prefix_sum)
+
+    return dataset
+
+
+def attach_shared_dataset(name: str, count: int) -> SharedDataset:
+    # The workers share the resource tracker of the creator, which owns and destroys the block
+    return SharedDataset(shared_memory.SharedMemory(name=name), count)
@@ -0,0 +1,401 @@
+from investment_strategy import *
+from time_series import *
+import numpy as np
+
+# Not important for the actual simulation, only important for the backend algorithm who MAY decide
+# for specific actions based on how much it is farming money
+INITIAL_INVESTMENT = 100
+
+# Relative margin applied to the candidate searches, so that the float rounding of the exact checks
+# never makes a candidate sample to be skipped
+CANDIDATE_MARGIN = 1e-9
+
+
+class SimulationEvent:
+    def __init__(self, index: int, timestamp: int, action: Action, price: float, coin: float, base: float):
+        # Simulated sample index and state right after the action
+        self.index = index
+        self.timestamp = timestamp
+        self.action = action
+        self.price = price
+        self.current_coin_availability = coin
+        self.current_base_coin_availability = base
+
+
+class SimulationEvents:
+    def __init__(self, events: list[SimulationEvent], final_state: InternalState):
+        # Only the BUY/SELL/SELL_LOSS transitions and the state at the end of the simulation
+        self.events = events
+        self.final_state = final_state
+
+
+class SimulationColumns:
+    def __init__(self, count: int):
+        # One typed array per InternalState field, one element per simulated sample
+        self.timestamp = np.zeros(count, dtype=np.int64)
+        self.current_price = np.zeros(count)
+        self.current_coin_availability = np.zeros(count)
+        self.current_base_coin_availability = np.zeros(count)
+        self.current_price_ratio = np.zeros(count)
+        self.last_price_ratio = np.zeros(count)
+        self.considered_avg = np.zeros(count)
+        self.considered_short_avg = np.zeros(count)
+        self.considered_long_avg = np.zeros(count)
+        self.last_action = np.zeros(count, dtype=np.int8)
+        self.last_action_ts = np.zeros(count, dtype=np.int64)
+        self.last_buy_price = np.zeros(count)
+
+        # The transitions, to avoid scanning the last_action column
+        self.events = []
+
+    def __len__(self) -> int:
+        return len(self.timestamp)
+
+
+class KernelResult:
+    def __init__(self):
+        # Index of the first simulated sample and the simulated series (one element per simulated sample)
+        self.start_index = 0
+        self.timestamps = None
+        self.prices = None
+        self.avg = None
+        self.short_avg = None
+        self.long_avg = None
+        self.current_ratio = None
+        self.last_ratio = None
+
+        # State right after every action: simulated sample index, action, coins, base coins, buy price
+        self.event_index = []
+        self.event_action = []
+        self.event_coin = []
+        self.event_base = []
+        self.event_buy_price = []
+
+    def final_state(self) -> InternalState:
+        state = InternalState()
+        last = len(self.timestamps) - 1
+        state.timestamp = int(self.timestamps[last])
+        state.current_price = float(self.prices[last])
+        state.current_price_ratio = float(self.current_ratio[last])
+        state.last_price_ratio = float(self.last_ratio[last])
+        state.considered_avg = float(self.avg[last])
+        state.considered_short_avg = float(self.short_avg[last])
+        state.considered_long_avg = float(self.long_avg[last])
+
+        # The balances are the ones after the last action
+        state.current_base_coin_availability = INITIAL_INVESTMENT
+        if len(self.event_index) != 0:
+            state.last_action = self.event_action[-1]
+            state.last_action_ts = int(self.timestamps[self.event_index[-1]])
+            state.last_buy_price = self.event_buy_price[-1]
+            state.current_coin_availability = self.event_coin[-1]
+            state.current_base_coin_availability = self.event_base[-1]
+
+        return state
+
+
+class RangeSearch:
+    def __init__(self, values: np.ndarray):
+        # Sparse table: levels[k][j] is the max of values[j:j + 2^k]
+        self.levels = [np.asarray(values, dtype=np.float64)]
+        half = 1
+        while half * 2 <= len(values):
+            previous = self.levels[-1]
+            self.levels.append(np.maximum(
+                previous[:len(previous) - half], previous[half:]))
+            half *= 2
+
+    def find_first_above(self, start: int, threshold: float) -> int:
+        # Skip the blocks whose max does not exceed the threshold, from the biggest to the smallest
+        index = start
+        for k in range(len(self.levels) - 1, -1, -1):
+            level = self.levels[k]
+            if index < len(level) and level[index] <= threshold:
+                index += 1 << k
+
+        # First index from start with a value greater than the threshold (len(values) if there is none)
+        return index
+
+
+class EventIndex:
+    def __init__(self, result: KernelResult):
+        # Searches shared by all the configurations with the same indicators, every one of them
+        # returns the first sample from which a decision may change the state
+        self.timestamps = result.timestamps
+
+        # Selling above a price or stopping the loss under an average
+        self.price_search = RangeSearch(result.prices)
+        self.avg_search = RangeSearch(-result.avg)
+
+        # Buying when the price is enough under the average
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.discount_search = RangeSearch(1 - result.prices / result.avg)
+
+        # Samples where the short average crosses the long one
+        self.cross_candidates = np.flatnonzero(
+            (result.current_ratio <= 1) & (result.last_ratio > 1))
+
+    def find_next_sell(self, start: int, buy_price: float, min_gain: float) -> int:
+        # Threshold algorithm: 1 - buy_price / price > min_gain
+        if min_gain >= 1:
+            return len(self.timestamps)
+        return self.price_search.find_first_above(start, buy_price / (1 - min_gain) * (1 - CANDIDATE_MARGIN))
+
+    def find_next_cross(self, start: int) -> int:
+        # Crossover algorithm: current_ratio <= 1 and last_ratio > 1
+        position = int(np.searchsorted(self.cross_candidates, start))
+        return int(self.cross_candidates[position]) if position < len(self.cross_candidates) else len(self.timestamps)
+
+    def find_next_stop_loss(self, start: int, buy_price: float, stop_loss: float) -> int:
+        # 1 - avg / buy_price > stop_loss
+        return self.avg_search.find_first_above(start, -buy_price * (1 - stop_loss) * (1 + CANDIDATE_MARGIN))
+
+    def find_next_buy(self, start: int, buy_delta: float) -> int:
+        # price <= avg - avg * buy_delta
+        return self.discount_search.find_first_above(start, buy_delta - CANDIDATE_MARGIN)
+
+    def find_sleep_end(self, start: int, last_action_ts: int, sleep_seconds: float) -> int:
+        # First sample after the sleep following a stop loss
+        return max(start, int(np.searchsorted(self.timestamps, last_action_ts + sleep_seconds, side="right")))
+
+
+def compute_rolling_avg(prices: np.ndarray, initial_avg: float, window: int, start: int) -> np.ndarray:
+    # The simulator propagates the average by adding the new sample and removing the oldest one
+    # of a window as long as the first one, thus the whole series is the cumulative sum of the deltas
+    deltas = prices[start:] - prices[start - window:len(prices) - window]
+    return initial_avg + np.cumsum(deltas) / window
+
+
+def compute_indicators(config: UserConfiguration, data_ts: list, data_price: list, series: TimeSeries = None) -> KernelResult:
+    # The series can be shared among many simulations on the same data
+    if series is None:
+        series = TimeSeries(data_ts, data_price)
+
+    ts = np.asarray(data_ts, dtype=np.int64)
+    prices = np.asarray(data_price, dtype=np.float64)
+
+    # Compute the windows as the simulator does
+    starting_index = series.find_window_start(config.AVG_HRS)
+    starting_index_short = series.find_window_start(
+        config.SHORT_AVG_HRS) if config.SHORT_AVG_HRS != 0 else 0
+    starting_index_long = series.find_window_start(
+        config.LONG_AVG_HRS) if config.LONG_AVG_HRS != 0 else 0
+    start = max(starting_index, starting_index_short, starting_index_long)
+    count = len(ts) - start
+
+    result = KernelResult()
+    result.start_index = start
+    result.timestamps = ts[start:]
+    result.prices = prices[start:]
+
+    # Vectorized averages and ratios for the whole series
+    result.avg = compute_rolling_avg(prices, series.get_avg_price(
+        config.AVG_HRS, data_ts[start]), starting_index, start)
+
+    initial_short = series.get_avg_price(
+        config.SHORT_AVG_HRS, data_ts[start]) if config.SHORT_AVG_HRS != 0 else 0
+    initial_long = series.get_avg_price(
+        config.LONG_AVG_HRS, data_ts[start]) if config.LONG_AVG_HRS != 0 else 0
+
+    if config.LONG_AVG_HRS != 0 and config.SHORT_AVG_HRS != 0:
+        result.short_avg = compute_rolling_avg(
+            prices, initial_short, starting_index_short, start)
+        result.long_avg = compute_rolling_avg(
+            prices, initial_long, starting_index_long, start)
+        result.current_ratio = result.short_avg / result.long_avg
+        result.last_ratio = np.concatenate(
+            ([0.0], result.current_ratio[:-1]))
+    else:
+        result.short_avg = np.full(count, float(initial_short))
+        result.long_avg = np.full(count, float(initial_long))
+        result.current_ratio = np.zeros(count)
+        result.last_ratio = np.zeros(count)
+
+    return result
+
+
+def run_kernel(config: UserConfiguration, data_ts: list, data_price: list, series: TimeSeries = None) -> KernelResult:
+    # Check configuration
+    if config.SHORT_AVG_HRS > config.LONG_AVG_HRS and config.LONG_AVG_HRS != 0 and config.SHORT_AVG_HRS:
+        print("[ERR] Long average is less than small average")
+        return
+
+    # The indicators depend only on the averaging windows, the actions on all the other parameters
+    result = compute_indicators(config, data_ts, data_price, series)
+    run_state_machine(config, result)
+
+    return result
+
+
+def run_state_machine(config: UserConfiguration, result: KernelResult, index: EventIndex = None):
+    # The index can be shared among the configurations with the same indicators
+    if index is None:
+        index = EventIndex(result)
+
+    timestamps = result.timestamps
+    prices = result.prices
+    avgs = result.avg
+    current_ratios = result.current_ratio
+    last_ratios = result.last_ratio
+    count = len(timestamps)
+
+    # Constants of make_threshold_decision and make_crossover_decision
+    is_threshold = config.ALGORITHM_TYPE == AlgorithmType.THRESHOLD
+    is_crossover = config.ALGORITHM_TYPE == AlgorithmType.CROSSOVER
+    min_gain = config.MIN_GAIN / 100.0
+    min_cross_gain = 1 + (config.BUY_TAX + config.SELL_TAX) / 100
+    stop_loss = config.STOP_LOSS / 100.0
+    buy_delta = (config.BUY_TAX + config.SELL_TAX + config.MIN_DELTA) / 100.0
+    sleep_seconds = config.SLEEP_DAYS_AFTER_LOSS * 24 * 60 * 60
+
+    last_action = Action.NONE
+    last_action_ts = 0
+    last_buy_price = 0
+    coin = 0
+    base = INITIAL_INVESTMENT
+
+    # Only the algorithms known by make_decision take actions
+    if not is_threshold and not is_crossover:
+        return
+
+    # Jump from a candidate sample to the next one, the others cannot change the state
+    i = 0
+    while True:
+        if last_action == Action.BUY:
+            if is_threshold:
+                next_index = index.find_next_sell(i, last_buy_price, min_gain)
+            else:
+                next_index = index.find_next_cross(i)
+            if config.STOP_LOSS != 0:
+                next_index = min(next_index, index.find_next_stop_loss(
+                    i, last_buy_price, stop_loss))
+        elif base != 0:
+            start = i
+            if last_action == Action.SELL_LOSS:
+                start = index.find_sleep_end(i, last_action_ts, sleep_seconds)
+            next_index = index.find_next_buy(start, buy_delta)
+        else:
+            break
+
+        if next_index >= count:
+            break
+        i = int(next_index)
+
+        price = float(prices[i])
+        avg = float(avgs[i])
+        decision = Action.NONE
+
+        # Same checks of the decision functions, in the same order
+        if last_action == Action.BUY:
+            if is_threshold and (1 - (last_buy_price / price)) > min_gain:
+                decision = Action.SELL
+            elif is_crossover and current_ratios[i] <= 1 and last_ratios[i] > 1 and (price / last_buy_price > min_cross_gain):
+                decision = Action.SELL
+            elif config.STOP_LOSS != 0 and (1 - avg / last_buy_price) > stop_loss:
+                decision = Action.SELL_LOSS
+        elif (last_action != Action.SELL_LOSS or timestamps[i] - last_action_ts > sleep_seconds) and \
+                price <= (avg - avg * buy_delta) and base != 0:
+            decision = Action.BUY
+
+        if decision == Action.NONE:
+            i += 1
+            continue
+
+        # Update the internal state as the simulator does
+        if decision == Action.BUY:
+            investment = base
+            last_buy_price = price
+            coin = (investment - (config.BUY_TAX / 100.0)
+                    * investment) / price
+            base = 0
+        else:
+            value = coin * price
+            base += value - (config.SELL_TAX / 100.0) * value
+            coin = 0
+
+        last_action = decision
+        last_action_ts = int(timestamps[i])
+
+        # Register the event
+        result.event_index.append(i)
+        result.event_action.append(decision)
+        result.event_coin.append(coin)
+        result.event_base.append(base)
+        result.event_buy_price.append(last_buy_price)
+
+        i += 1
+
+
+def kernel_to_events(result: KernelResult) -> list[SimulationEvent]:
+    events = []
+    for i in range(len(result.event_index)):
+        index = result.event_index[i]
+        events.append(SimulationEvent(index, int(result.timestamps[index]), result.event_action[i], float(result.prices[index]),
+                                      result.event_coin[i], result.event_base[i]))
+    return events
+
+
+def kernel_to_columns(result: KernelResult) -> SimulationColumns:
+    count = len(result.timestamps)
+    columns = SimulationColumns(count)
+
+    columns.timestamp[:] = result.timestamps
+    columns.current_price[:] = result.prices
+    columns.current_price_ratio[:] = result.current_ratio
+    columns.last_price_ratio[:] = result.last_ratio
+    columns.considered_avg[:] = result.avg
+    columns.considered_short_avg[:] = result.short_avg
+    columns.considered_long_avg[:] = result.long_avg
+    columns.current_base_coin_availability[:] = INITIAL_INVESTMENT
+    columns.events = kernel_to_events(result)
+
+    if len(result.event_index) == 0:
+        return columns
+
+    # For every sample find the last event that happened up to it, the state does not change in between
+    event_index = np.asarray(result.event_index, dtype=np.int64)
+    last_event = np.searchsorted(
+        event_index, np.arange(count), side="right") - 1
+    after = last_event >= 0
+    last_event = last_event[after]
+
+    columns.last_action[after] = np.asarray(
+        [action.value for action in result.event_action], dtype=np.int8)[last_event]
+    columns.last_action_ts[after] = result.timestamps[event_index][last_event]
+    columns.last_buy_price[after] = np.asarray(
+        result.event_buy_price)[last_event]
+    columns.current_coin_availability[after] = np.asarray(result.event_coin)[
+        last_event]
+    columns.current_base_coin_availability[after] = np.asarray(result.event_base)[
+        last_event]
+
+    return columns
+
+
+def columns_to_states(columns: SimulationColumns) -> list[InternalState]:
+    # Python values are faster than numpy scalars when accessed one by one
+    fields = {}
+    for field in ["timestamp", "current_price", "current_coin_availability", "current_base_coin_availability",
+                  "current_price_ratio", "last_price_ratio", "considered_avg", "considered_short_avg",
+                  "considered_long_avg", "last_action_ts", "last_buy_price"]:
+        fields[field] = getattr(columns, field).tolist()
+    actions = [Action(value) for value in columns.last_action.tolist()]
+
+    simulation_result = []
+    for i in range(len(columns)):
+        state = InternalState()
+        for field, values in fields.items():
+            setattr(state, field, values[i])
+        state.last_action = actions[i]
+        simulation_result.append(state)
+
+    return simulation_result
+
+
+def simulate_vectorized(config: UserConfiguration, data_ts: list, data_price: list) -> list[InternalState]:
+    # Drop-in replacement of simulator.simulate
+    result = run_kernel(config, data_ts, data_price)
+    if result is None:
+        return
+
+    return columns_to_states(kernel_to_columns(result))
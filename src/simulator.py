@@ -1,31 +1,58 @@
 import copy
 from investment_strategy import *
+from simulation_kernel import *
+from time_series import *
+from enum import Enum
 import matplotlib.pyplot as plt
 import datetime as dt
 import time
+import bisect
 
 # Not important for the actual simulation, only important for the backend algorithm who MAY decide
 # for specific actions based on how much it is farming money
 INITIAL_INVESTMENT = 100
 
 
+class SimulationOutput(Enum):
+    # One InternalState object per simulated sample
+    STATES = 0
+    # One typed array per InternalState field (SimulationColumns)
+    COLUMNS = 1
+    # Only the actions and the final state (SimulationEvents)
+    EVENTS = 2
+
+
 def compute_avg_price(data_ts: list, data_price: list, avg_hrs: int, starting_timestamp: int):
-    # Delta in seconds that the requested average impacts on the timestamp
-    delta_seconds = avg_hrs * 60 * 60
+    # Locate the window with a binary search instead of scanning the data from the beginning
+    first = bisect.bisect_right(data_ts, starting_timestamp - avg_hrs * 60 * 60)
+    last = bisect.bisect_left(data_ts, starting_timestamp)
 
-    # Sum all the prices that correspond to a timestamp that is inside the considered average window
+    # Sum all the prices that correspond to a timestamp that is inside the considered average window,
+    # in fixed point as TimeSeries does
     result = 0
-    counter = 0
-    for i in range(len(data_ts)):
-        if data_ts[i] < starting_timestamp and data_ts[i] > starting_timestamp - delta_seconds:
-            result += data_price[i]
-            counter += 1
-        elif data_ts[i] > starting_timestamp:
-            break
-    return float(result) / counter
+    for i in range(first, last):
+        result += to_fixed_point(data_price[i])
+    return result / (PRICE_SCALE * (last - first))
+
+
+def simulate(config: UserConfiguration, data_ts, data_price, output: SimulationOutput = SimulationOutput.STATES, series: TimeSeries = None):
+    # The series can be shared among many simulations on the same data
+    if series is None:
+        series = TimeSeries(data_ts, data_price)
 
+    # The compact outputs are produced by the vectorized kernel
+    if output == SimulationOutput.COLUMNS or output == SimulationOutput.EVENTS:
+        result = run_kernel(config, data_ts, data_price, series)
+        if result is None:
+            # An invalid configuration makes no action and ends with nothing, the optimizers score it 0
+            if output == SimulationOutput.EVENTS:
+                return SimulationEvents([], InternalState())
+            return
+
+        if output == SimulationOutput.COLUMNS:
+            return kernel_to_columns(result)
+        return SimulationEvents(kernel_to_events(result), result.final_state())
 
-def simulate(config: UserConfiguration, data_ts, data_price) -> list[InternalState]:
     # Check configuration
     if config.SHORT_AVG_HRS > config.LONG_AVG_HRS and config.LONG_AVG_HRS != 0 and config.SHORT_AVG_HRS:
         print("[ERR] Long average is less than small average")
@@ -35,49 +62,30 @@ def simulate(config: UserConfiguration, data_ts, data_price) -> list[InternalSta
     state = InternalState()
     state.current_base_coin_availability = INITIAL_INVESTMENT
 
-    # Find the first location in the data which has enough previous samples to compute the average
-    starting_index = 0
-    first_ts = data_ts[0]
-    for i in range(len(data_ts)):
-        if data_ts[i] > first_ts + config.AVG_HRS * 60 * 60:
-            starting_index = i
-            break
-
-    # Find the first location in the data which has enough previous samples to compute the long average
-    starting_index_short = 0
-    if config.SHORT_AVG_HRS != 0:
-        first_ts = data_ts[0]
-        for i in range(len(data_ts)):
-            if data_ts[i] > first_ts + config.SHORT_AVG_HRS * 60 * 60:
-                starting_index_short = i
-                break
-
-    # Find the first location in the data which has enough previous samples to compute the long average
-    starting_index_long = 0
-    if config.LONG_AVG_HRS != 0:
-        first_ts = data_ts[0]
-        for i in range(len(data_ts)):
-            if data_ts[i] > first_ts + config.LONG_AVG_HRS * 60 * 60:
-                starting_index_long = i
-                break
+    # Find the first location in the data which has enough previous samples to compute the averages
+    starting_index = series.find_window_start(config.AVG_HRS)
+    starting_index_short = series.find_window_start(
+        config.SHORT_AVG_HRS) if config.SHORT_AVG_HRS != 0 else 0
+    starting_index_long = series.find_window_start(
+        config.LONG_AVG_HRS) if config.LONG_AVG_HRS != 0 else 0
 
     # Compute the highest index from which the simulation shall start
     absolute_starting_index = max(
         starting_index, starting_index_long, starting_index_short)
 
     # Compute initial average
-    state.considered_avg = compute_avg_price(
-        data_ts, data_price, config.AVG_HRS, data_ts[absolute_starting_index])
+    state.considered_avg = series.get_avg_price(
+        config.AVG_HRS, data_ts[absolute_starting_index])
 
     # Compute the initial short average
     if config.SHORT_AVG_HRS != 0:
-        state.considered_short_avg = compute_avg_price(
-            data_ts, data_price, config.SHORT_AVG_HRS, data_ts[absolute_starting_index])
+        state.considered_short_avg = series.get_avg_price(
+            config.SHORT_AVG_HRS, data_ts[absolute_starting_index])
 
     # Compute the initial long average
     if config.LONG_AVG_HRS != 0:
-        state.considered_long_avg = compute_avg_price(
-            data_ts, data_price, config.LONG_AVG_HRS, data_ts[absolute_starting_index])
+        state.considered_long_avg = series.get_avg_price(
+            config.LONG_AVG_HRS, data_ts[absolute_starting_index])
 
     simulation_result = [InternalState() for i in range(
         len(data_ts) - absolute_starting_index)]
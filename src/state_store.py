@@ -0,0 +1,102 @@
+from investment_strategy import *
+import pickle
+import json
+import os
+
+# Change it every time the stored fields change
+STATE_VERSION = 1
+
+# Fields needed to take the right decision after a restart, the others are refreshed at every update
+STATE_FIELDS = ["last_action", "last_buy_price", "last_action_ts", "current_price_ratio",
+                "last_price_ratio", "considered_short_avg", "considered_long_avg"]
+
+
+def create_default_state() -> InternalState:
+    state = InternalState()
+    state.last_action = Action.NONE
+    state.last_buy_price = 0
+    state.last_action_ts = 0
+    state.last_price_ratio = 0
+    state.considered_long_avg = 0
+    state.considered_short_avg = 0
+    state.current_price_ratio = 0
+    return state
+
+
+def get_state_key(state: InternalState) -> tuple:
+    # The crossover decisions only check on which side of 1 the ratios are, the exact
+    # values change at every update and are not worth a write
+    return (state.last_action, state.last_buy_price, state.last_action_ts,
+            state.current_price_ratio > 1, state.last_price_ratio > 1)
+
+
+def encode_state(state: InternalState) -> bytes:
+    fields = {field: getattr(state, field) for field in STATE_FIELDS}
+    fields["last_action"] = state.last_action.name
+    return json.dumps({"version": STATE_VERSION, "state": fields}).encode("utf-8")
+
+
+def decode_state(content: bytes) -> InternalState:
+    state = create_default_state()
+
+    # The old states were pickled
+    if content[:1] == b"\x80":
+        old_state = pickle.loads(content)
+        for field in STATE_FIELDS:
+            setattr(state, field, getattr(old_state, field))
+        return state
+
+    data = json.loads(content)
+    if data["version"] != STATE_VERSION:
+        raise Exception(
+            f"[ERR] Unsupported internal state version {data['version']}")
+
+    for field in STATE_FIELDS:
+        setattr(state, field, data["state"][field])
+    state.last_action = Action[data["state"]["last_action"]]
+    return state
+
+
+class StateStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+
+        # Key of the last persisted state of every configuration
+        self.saved = {}
+
+    def get_path(self, name: str) -> str:
+        return os.path.join(self.directory, name + ".state")
+
+    def load(self, name: str) -> InternalState:
+        path = self.get_path(name)
+
+        # If the file does not exist, return the default internal state
+        if not os.path.exists(path):
+            print("[INFO] Non pre existing internal state log file, returning default one")
+            return create_default_state()
+
+        with open(path, "rb") as file:
+            content = file.read()
+        state = decode_state(content)
+
+        # The old formats are converted at the first save
+        if content[:1] != b"\x80":
+            self.saved[name] = get_state_key(state)
+        return state
+
+    def save(self, name: str, state: InternalState) -> bool:
+        # Write only when a field used by the decisions changed
+        key = get_state_key(state)
+        if self.saved.get(name) == key:
+            return False
+
+        # Write a temporary file and replace the old one, a crash never leaves a partial state
+        path = self.get_path(name)
+        with open(path + ".tmp", "wb") as file:
+            file.write(encode_state(state))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
+
+        self.saved[name] = key
+        return True
@@ -0,0 +1,215 @@
+from candle_dataset import *
+from pathlib import Path
+import socketserver
+import threading
+import datetime as dt
+import hashlib
+import base64
+import struct
+import json
+import time
+import os
+import argparse
+
+# Magic string defined by the WebSocket protocol (RFC 6455) for the handshake
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OPCODE_TEXT = 0x1
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+
+def read_log_file(path: str, start: int = None, end: int = None) -> tuple[list, list]:
+    # Read the CSV log file or the binary dataset
+    log_location = Path(__file__).absolute().parent
+    file_location = log_location / path
+
+    # Verify the log file presence
+    if not os.path.exists(file_location):
+        raise Exception("[ERR] The log file does not exist")
+
+    # The events are serialized as JSON, thus use Python values
+    (data_ts, data_price) = read_price_log(str(file_location), start, end)
+    return ([int(timestamp) for timestamp in data_ts], [float(price) for price in data_price])
+
+
+def receive_exactly(conn, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed by the client")
+        data += chunk
+    return data
+
+
+def receive_frame(conn) -> tuple[int, bytes]:
+    header = receive_exactly(conn, 2)
+    opcode = header[0] & 0x0F
+    length = header[1] & 0x7F
+
+    # Extended payload length
+    if length == 126:
+        length = struct.unpack("!H", receive_exactly(conn, 2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", receive_exactly(conn, 8))[0]
+
+    # The client frames are always masked
+    mask = receive_exactly(conn, 4) if header[1] & 0x80 else b"\x00" * 4
+    payload = receive_exactly(conn, length)
+    payload = bytes(payload[i] ^ mask[i % 4] for i in range(length))
+
+    return (opcode, payload)
+
+
+def send_frame(conn, payload: bytes, opcode: int = OPCODE_TEXT):
+    # The server frames are never masked
+    header = bytes([0x80 | opcode])
+    if len(payload) < 126:
+        header += bytes([len(payload)])
+    elif len(payload) < 65536:
+        header += bytes([126]) + struct.pack("!H", len(payload))
+    else:
+        header += bytes([127]) + struct.pack("!Q", len(payload))
+
+    conn.sendall(header + payload)
+
+
+def accept_handshake(conn):
+    # Read the HTTP upgrade request
+    request = b""
+    while b"\r\n\r\n" not in request:
+        chunk = conn.recv(1024)
+        if not chunk:
+            raise ConnectionError("Connection closed during the handshake")
+        request += chunk
+
+    key = ""
+    for line in request.decode("utf-8").split("\r\n"):
+        if line.lower().startswith("sec-websocket-key:"):
+            key = line.split(":", 1)[1].strip()
+
+    accept = base64.b64encode(hashlib.sha1(
+        (key + WEBSOCKET_GUID).encode("utf-8")).digest()).decode("utf-8")
+
+    conn.sendall(("HTTP/1.1 101 Switching Protocols\r\n" +
+                  "Upgrade: websocket\r\n" +
+                  "Connection: Upgrade\r\n" +
+                  f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode("utf-8"))
+
+
+def create_kline(coin_name: str, event_ts: int, open_ts: int, open: float, close: float, closed: bool) -> dict:
+    return {"stream": coin_name.lower() + "@kline_1m",
+            "data": {"e": "kline", "E": event_ts * 1000, "s": coin_name,
+                     "k": {"t": open_ts * 1000, "T": open_ts * 1000 + 59999, "s": coin_name, "i": "1m",
+                           "o": str(open), "c": str(close), "x": closed}}}
+
+
+def create_events(coin_name: str, data_ts: list, data_price: list, index: int) -> list:
+    # The log contains one price per minute: it is the open price of its candle and the close
+    # price of the previous one
+    timestamp = data_ts[index]
+    price = data_price[index]
+    events = []
+
+    # Close the previous candle
+    if index > 0:
+        events.append(create_kline(coin_name, timestamp,
+                      data_ts[index - 1], data_price[index - 1], price, True))
+
+    # Report the trade and open the new candle
+    events.append({"stream": coin_name.lower() + "@trade",
+                   "data": {"e": "trade", "E": timestamp * 1000, "s": coin_name, "p": str(price), "T": timestamp * 1000}})
+    events.append(create_kline(coin_name, timestamp,
+                  timestamp, price, price, False))
+
+    return events
+
+
+class ReplayHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        conn = self.request
+        accept_handshake(conn)
+
+        # Wait for the subscription request and confirm it
+        (opcode, payload) = receive_frame(conn)
+        if opcode != OPCODE_TEXT:
+            return
+        request = json.loads(payload)
+        send_frame(conn, json.dumps(
+            {"result": None, "id": request.get("id")}).encode("utf-8"))
+        print(f"[INFO] Client subscribed to {request.get('params')}")
+
+        # Listen for the close request in background
+        closed = threading.Event()
+
+        def listen():
+            try:
+                while not closed.is_set():
+                    (opcode, payload) = receive_frame(conn)
+                    if opcode == OPCODE_PING:
+                        send_frame(conn, payload, OPCODE_PONG)
+                    elif opcode == OPCODE_CLOSE:
+                        break
+            except Exception:
+                pass
+            closed.set()
+
+        threading.Thread(target=listen, daemon=True).start()
+
+        # Replay the log one minute at a time
+        server = self.server
+        for i in range(server.starting_index, len(server.data_ts)):
+            if closed.is_set():
+                break
+
+            for event in create_events(server.coin_name, server.data_ts, server.data_price, i):
+                send_frame(conn, json.dumps(event).encode("utf-8"))
+
+            time.sleep(60.0 / server.speed)
+
+        # Close the connection once the log is over
+        if not closed.is_set():
+            send_frame(conn, b"", OPCODE_CLOSE)
+        closed.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="A program that replays a log downloaded with the data gatherer as a local binance market stream")
+    parser.add_argument("-l", "--log", help="log file", required=True)
+    parser.add_argument(
+        "-c", "--coin", help="the Binance coin name (E.g. BTCUSDT)", required=True)
+    parser.add_argument(
+        "-p", "--port", default=9443, help="the local port to listen to (Default: 9443)")
+    parser.add_argument(
+        "-s", "--speed", default=60, help="how many minutes of the log are replayed every minute (Default: 60)")
+    parser.add_argument(
+        "--start", default=0, help="the unix timestamp from which the replay starts (Default: the beginning of the log)")
+
+    # Parse the input data from user
+    args = parser.parse_args()
+
+    (data_ts, data_price) = read_log_file(args.log)
+
+    # Skip the samples before the requested start
+    starting_index = 0
+    while starting_index < len(data_ts) and data_ts[starting_index] < int(args.start):
+        starting_index += 1
+
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    with socketserver.ThreadingTCPServer(("localhost", int(args.port)), ReplayHandler) as server:
+        server.coin_name = args.coin
+        server.data_ts = data_ts
+        server.data_price = data_price
+        server.starting_index = starting_index
+        server.speed = float(args.speed)
+
+        print(
+            f"[INFO] Replaying {args.log} from {dt.datetime.fromtimestamp(data_ts[starting_index])} on ws://localhost:{args.port}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,15 @@
 from json_configuration_reader import *
 from investment_strategy import *
 from simulator import *
+from candle_dataset import *
 import matplotlib.pyplot as plt
 import datetime as dt
-import csv
 
 INITIAL_INVESTMENT = 100
 LOG_FILE = "../execution_logs/PEPEUSDT-150.csv"
+# Unix timestamps delimiting the simulated part of the log (None for the whole log)
+LOG_START = None
+LOG_END = None
 COIN_NAME = "PEPEUSDT"
 CURRENCY_NAME = "PEPE"
 BASE_CURRENCY_NAME = "USDT"
@@ -20,8 +23,8 @@ SLEEP_DAYS_AFTER_LOSS = 5
 MAX_INVESTMENT = 10000
 
 
-def read_log_file(path: str) -> tuple[list, list]:
-    # Read the CSV log file
+def read_log_file(path: str, start: int = None, end: int = None) -> tuple[list, list]:
+    # Read the CSV log file or the binary dataset
     log_location = Path(__file__).absolute().parent
     file_location = log_location / path
 
@@ -29,20 +32,11 @@ def read_log_file(path: str) -> tuple[list, list]:
     if not os.path.exists(file_location):
         raise Exception("[ERR] The log file does not exist")
 
-    # Open the file
-    file = file_location.open()
-    reader = csv.DictReader(file)
+    # Read only the samples in the requested range
+    (data_ts, data_price) = read_price_log(str(file_location), start, end)
+    data_unix = [dt.datetime.fromtimestamp(int(timestamp))
+                 for timestamp in data_ts]
 
-    # Read the content
-    data_ts = []
-    data_price = []
-    data_unix = []
-    for row in reader:
-        data_ts.append(int(row["timestamp"]))
-        data_price.append(float(row["current_price"]))
-        data_unix.append(dt.datetime.fromtimestamp(int(row["timestamp"])))
-
-    file.close()
     return (data_ts, data_unix, data_price)
 
 
@@ -66,42 +60,39 @@ def main():
     state.current_base_coin_availability = INITIAL_INVESTMENT
 
     # Gather the data
-    (data_ts, data_date, data_price) = read_log_file(LOG_FILE)
+    (data_ts, data_date, data_price) = read_log_file(LOG_FILE, LOG_START, LOG_END)
 
     # Create plots
     fig, ax = plt.subplots()
 
     # Simulate the event with the simulator class
-    simulation_result = simulate(config, data_ts, data_price)
+    simulation_result = simulate(
+        config, data_ts, data_price, SimulationOutput.COLUMNS)
 
-    # Retrieve the simulation objects
+    # Retrieve the simulation columns
     avg_time = [dt.datetime.fromtimestamp(
-        sim_step.timestamp) for sim_step in simulation_result]
-    avg_price = [sim_step.considered_avg for sim_step in simulation_result]
+        timestamp) for timestamp in simulation_result.timestamp.tolist()]
+    avg_price = simulation_result.considered_avg
 
     # Evaluate all the actions
-    prev_action = Action.NONE
-    for sim_step in simulation_result:
-        date_timestamp = dt.datetime.fromtimestamp(sim_step.timestamp)
+    for event in simulation_result.events:
+        date_timestamp = dt.datetime.fromtimestamp(event.timestamp)
         # Buy action
-        if sim_step.last_action != prev_action and sim_step.last_action == Action.BUY:
+        if event.action == Action.BUY:
             ax.axvline(date_timestamp, color="b", label="BUY")
 
             # Report the buy action
             print(
                 f"[{date_timestamp}]BUY \t {config.BASE_CURRENCY_NAME}:\t" +
-                f"{sim_step.current_base_coin_availability: .2f}\t{config.CURRENCY_NAME}:\t{sim_step.current_coin_availability:.8f}")
+                f"{event.current_base_coin_availability: .2f}\t{config.CURRENCY_NAME}:\t{event.current_coin_availability:.8f}")
         # Sell action
-        elif sim_step.last_action != prev_action and (sim_step.last_action == Action.SELL or sim_step.last_action == Action.SELL_LOSS):
+        elif event.action == Action.SELL or event.action == Action.SELL_LOSS:
             ax.axvline(date_timestamp, color="g", label="SELL")
 
             # Report the sell action
             print(
                 f"[{date_timestamp}]SELL \t {config.BASE_CURRENCY_NAME}:\t" +
-                f"{sim_step.current_base_coin_availability:.2f}\t{config.CURRENCY_NAME}:\t{sim_step.current_coin_availability:.8f}")
-
-        # Update the previous action
-        prev_action = sim_step.last_action
+                f"{event.current_base_coin_availability:.2f}\t{config.CURRENCY_NAME}:\t{event.current_coin_availability:.8f}")
 
     # Plot also the average considered price
     ax.plot(data_date, data_price)
@@ -1,9 +1,13 @@
-import itertools
 import multiprocessing
 from binance_interface import *
 from simulator import *
-import decimal
-import csv
+from shared_dataset import *
+from batch_simulator import *
+from search_strategies import *
+from score_cache import *
+from candle_dataset import *
+import argparse
+import copy
 
 LOG_FILE = "../execution_logs/PEPEUSDT-150.csv"
 COIN_NAME = "PEPEUSDT"
@@ -29,14 +33,8 @@ config.STOP_LOSS = STOP_LOSS
 config.SLEEP_DAYS_AFTER_LOSS = SLEEP_DAYS_AFTER_LOSS
 
 
-def drange(x, y, jump):
-    while x < y:
-        yield truncate(float(x), get_increment_from_string(jump))
-        x += float(decimal.Decimal(jump))
-
-
-def read_log_file(path: str) -> tuple[list, list]:
-    # Read the CSV log file
+def read_log_file(path: str, start: int = None, end: int = None) -> tuple[list, list]:
+    # Read the CSV log file or the binary dataset
     log_location = Path(__file__).absolute().parent
     file_location = log_location / path
 
@@ -44,30 +42,29 @@ def read_log_file(path: str) -> tuple[list, list]:
     if not os.path.exists(file_location):
         raise Exception("[ERR] The log file does not exist")
 
-    # Open the file
-    file = file_location.open()
-    reader = csv.DictReader(file)
+    # Read only the samples in the requested range
+    (data_ts, data_price) = read_price_log(str(file_location), start, end)
+    return (data_ts, data_price)
+
+
+# The log file is read once by the main process into shared memory, the workers attach to it
+dataset = None
+series = None
 
-    # Read the content
-    data_ts = []
-    data_price = []
-    data_unix = []
-    for row in reader:
-        data_ts.append(int(row["timestamp"]))
-        data_price.append(float(row["current_price"]))
-        data_unix.append(dt.datetime.fromtimestamp(int(row["timestamp"])))
 
-    file.close()
-    return (data_ts, data_unix, data_price)
+def init_worker(name: str, count: int):
+    global dataset, series
 
+    # Typed views over the shared block, no copy of the data
+    dataset = attach_shared_dataset(name, count)
 
-# Read the log file
-(data_ts, data_unix, data_price) = read_log_file(LOG_FILE)
+    # Index the data once for all the simulations
+    series = dataset.get_series()
 
 
-def evaluate_simulation(config: UserConfiguration, simulation_data: list[InternalState]):
+def evaluate_simulation(config: UserConfiguration, simulation_data: SimulationEvents):
     # Evaluate the final gain
-    final_state = simulation_data[len(simulation_data) - 1]
+    final_state = simulation_data.final_state
 
     # In case at the end there is only a sell action, sell the remaining amount
     if (final_state.current_base_coin_availability == 0):
@@ -77,28 +74,62 @@ def evaluate_simulation(config: UserConfiguration, simulation_data: list[Interna
     return final_state.current_base_coin_availability
 
 
-def objective(params):
-    avg_hrs, min_gain, min_delta = params
+def objective_batch(task):
+    names, points, fraction = task
 
-    config.AVG_HRS = int(avg_hrs)
-    config.MIN_GAIN = float(min_gain)
-    config.MIN_DELTA = float(min_delta)
+    # The search strategy may evaluate the points on a prefix of the data
+    data = series if fraction >= 1 else dataset.get_series(
+        int(dataset.count * fraction))
 
-    simulation_data = simulate(config, data_ts, data_price)
-    score = evaluate_simulation(config, simulation_data)
+    # Create a configuration for every point, the ones sharing the same average are simulated together
+    configs = []
+    for point in points:
+        point_config = copy.copy(config)
+        for name, value in zip(names, point):
+            setattr(point_config, name, value)
+        configs.append(point_config)
 
-    print(
-        f"Config ({score}): {avg_hrs} [AVG_HRS], {min_gain} [MIN_GAIN], {min_delta} [MIN_DELTA]")
+    simulations_data = simulate_batch(
+        configs, data.timestamps, data.prices, data)
 
-    return (avg_hrs, min_gain, min_delta, score)
+    results = []
+    for i in range(len(points)):
+        score = evaluate_simulation(configs[i], simulations_data[i])
+
+        print(f"Config ({score}): " + ", ".join(
+            [f"{value} [{name}]" for name, value in zip(names, points[i])]))
+        results.append((points[i], score))
+
+    return results
 
 
 def main():
+    parser = argparse.ArgumentParser(
+        description="A program that looks for the best threshold configuration on a log downloaded with the data gatherer")
+    parser.add_argument("-s", "--strategy", default="grid", choices=["grid", "random", "refine", "halving"],
+                        help="how the configurations are explored: the whole grid, random points, a coarse grid refined around the best points or random points successively halved on longer parts of the log (Default: grid)")
+    parser.add_argument(
+        "-b", "--budget", default=2000, help="how many simulations on the whole log the search can run, ignored by the grid (Default: 2000)")
+    parser.add_argument(
+        "--seed", default=None, help="the seed of the random choices (Default: random)")
+    parser.add_argument(
+        "--start", default=None, help="the unix timestamp from which the log is simulated (Default: the beginning of the log)")
+    parser.add_argument(
+        "--end", default=None, help="the unix timestamp up to which the log is simulated (Default: the end of the log)")
+    parser.add_argument(
+        "--cache", default=CACHE_FILE, help=f"the file storing the scores of the previous runs (Default: {CACHE_FILE})")
+    parser.add_argument(
+        "--cache-size", default=CACHE_MAX_ENTRIES, help=f"how many scores the cache keeps at most (Default: {CACHE_MAX_ENTRIES})")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="simulate every configuration, without reading or writing the cache")
+
+    # Parse the input data from user
+    args = parser.parse_args()
+
     AVG_HRS_MIN = 1
     AVG_HRS_MAX = 5
     AVG_HRS_STEP = 1
 
-    # TODO drange spins off in a loop if the step is not multiple of 1 (other digits than 1)
     MIN_GAIN_MIN = 0.3
     MIN_GAIN_MAX = 2
     MIN_GAIN_STEP = 0.1
@@ -107,26 +138,61 @@ def main():
     MIN_DELTA_MAX = 3.5
     MIN_DELTA_STEP = 0.1
 
-    avg_hrs = list[float](range(AVG_HRS_MIN, AVG_HRS_MAX, AVG_HRS_STEP))
-    min_gain = list[float](drange(MIN_GAIN_MIN, MIN_GAIN_MAX, MIN_GAIN_STEP))
-    min_delta = list[float](
-        drange(MIN_DELTA_MIN, MIN_DELTA_MAX, MIN_DELTA_STEP))
-
-    # Create the set of combinations
-    param_combinations = list(itertools.product(avg_hrs, min_gain, min_delta))
+    STOP_LOSS_MIN = 0
+    STOP_LOSS_MAX = 30
+    STOP_LOSS_STEP = 5
+
+    SLEEP_DAYS_MIN = 0
+    SLEEP_DAYS_MAX = 10
+    SLEEP_DAYS_STEP = 1
+
+    # Create the space of the configurations
+    space = SearchSpace([Parameter("AVG_HRS", AVG_HRS_MIN, AVG_HRS_MAX, AVG_HRS_STEP),
+                         Parameter("MIN_GAIN", MIN_GAIN_MIN,
+                                   MIN_GAIN_MAX, MIN_GAIN_STEP),
+                         Parameter("MIN_DELTA", MIN_DELTA_MIN,
+                                   MIN_DELTA_MAX, MIN_DELTA_STEP),
+                         Parameter("STOP_LOSS", STOP_LOSS_MIN,
+                                   STOP_LOSS_MAX, STOP_LOSS_STEP),
+                         Parameter("SLEEP_DAYS_AFTER_LOSS", SLEEP_DAYS_MIN, SLEEP_DAYS_MAX, SLEEP_DAYS_STEP)])
+    strategy = create_strategy(args.strategy, int(args.budget),
+                               int(args.seed) if args.seed is not None else None)
+
+    # Load the data once in shared memory
+    (log_ts, log_price) = read_log_file(LOG_FILE, int(args.start) if args.start is not None else None,
+                                        int(args.end) if args.end is not None else None)
+    shared = create_shared_dataset(log_ts, log_price)
+    del log_ts, log_price
+
+    # Reuse the scores of the previous runs on the same data
+    cache = None
+    if not args.no_cache:
+        cache = ScoreCache(get_absolute_path(args.cache), get_dataset_fingerprint(
+            shared.timestamps, shared.prices), config, int(args.cache_size))
 
     # In parallel look for the best result
-    with multiprocessing.Pool() as pool:
-        results = pool.map(objective, param_combinations)
+    processes = multiprocessing.cpu_count()
+    try:
+        with multiprocessing.Pool(processes, initializer=init_worker, initargs=(shared.memory.name, shared.count)) as pool:
+            results = strategy.search(space, create_pool_evaluator(
+                pool, processes, objective_batch, space.get_names(), cache))
+    finally:
+        shared.close()
+        shared.unlink()
+        if cache is not None:
+            cache.close()
+
+    # Restore the order of the points, the first best one wins
+    results.sort(key=lambda result: result[0])
 
     # look for the best result
     best = 0
     for i in range(len(results)):
-        if results[i][3] > results[best][3]:
+        if results[i][1] > results[best][1]:
             best = i
 
-    print(
-        f"Best config ({results[best][3]}): {results[best][0]} [AVG_HRS], {results[best][1]} [MIN_GAIN], {results[best][2]} [MIN_DELTA]")
+    print(f"Best config ({results[best][1]}): " + ", ".join(
+        [f"{value} [{name}]" for name, value in zip(space.get_names(), results[best][0])]))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,57 @@
+from exchange_cache import *
+from rate_limiter import *
+import datetime as dt
+import time
+
+# Seconds after the minute boundaries at which the ticks happen, so that the last candle is closed
+TICK_DELAY = 2
+
+# Allowed update periods: they divide a minute or are made of whole minutes, thus the ticks
+# always fall at the same seconds of a minute
+TICK_PERIODS = [5, 10, 15, 20, 30, 60, 120, 300, 600]
+
+
+class TickScheduler:
+    def __init__(self, period: int, clock: ServerClock, limiter: RateLimiter, delay: float = TICK_DELAY):
+        if period not in TICK_PERIODS:
+            raise Exception(
+                f"[ERR] The update period must be one of {TICK_PERIODS}")
+
+        # Period requested by the user, it is stretched while the ticks cost more than the budget
+        self.base_period = period
+        self.period = period
+        self.delay = delay
+        self.clock = clock
+        self.limiter = limiter
+
+        # Weight consumed by the limiter at the beginning of the tick
+        self.last_consumed = limiter.consumed
+
+    def adapt(self):
+        # Weight per minute needed to keep the current period with the cost of the last tick
+        weight = self.limiter.consumed - self.last_consumed
+        self.last_consumed = self.limiter.consumed
+        budget = self.limiter.requests_per_second * 60
+
+        # Shortest allowed period whose ticks fit the budget, never under the requested one
+        period = TICK_PERIODS[-1]
+        for candidate in TICK_PERIODS:
+            if candidate >= self.base_period and weight * 60 / candidate <= budget:
+                period = candidate
+                break
+
+        if period != self.period:
+            print(
+                f"[{dt.datetime.now()}][INFO] Update period set to {period} seconds, the last tick used {weight} request weight")
+            self.period = period
+
+    def get_delay(self) -> float:
+        # Seconds until the next tick on the server clock, the ticks lost by a slow one are skipped
+        now = time.time() + self.clock.offset
+        next_tick = ((now - self.delay) // self.period + 1) * \
+            self.period + self.delay
+        return next_tick - now
+
+    def wait(self):
+        self.adapt()
+        time.sleep(self.get_delay())
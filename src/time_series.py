@@ -0,0 +1,53 @@
+from fixed_point import *
+import bisect
+import numpy as np
+
+
+class TimeSeries:
+    def __init__(self, data_ts: list, data_price: list, prefix_sum: list = None):
+        # Samples sorted by timestamp, the typed arrays (E.g. a shared dataset) are used without copying them
+        self.timestamps = data_ts if isinstance(data_ts, np.ndarray) else list(data_ts)
+        self.prices = data_price if isinstance(data_price, np.ndarray) else list(data_price)
+
+        # Cumulative fixed point sum of the prices, prefix_sum[i] is the sum of the first i samples
+        if prefix_sum is None:
+            prefix_sum = np.zeros(len(self.prices) + 1, dtype=np.int64)
+            compute_prefix_sum(self.prices, prefix_sum)
+        self.prefix_sum = prefix_sum
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def find_window_start(self, avg_hrs: int) -> int:
+        # First sample which has enough previous samples to compute the average (0 if there is none)
+        index = bisect.bisect_right(
+            self.timestamps, self.timestamps[0] + avg_hrs * 60 * 60)
+        return index if index < len(self.timestamps) else 0
+
+    def get_window(self, avg_hrs: int, timestamp: int) -> tuple[int, int]:
+        # Indexes [first, last) of the samples strictly inside the (timestamp - avg_hrs, timestamp) window
+        first = bisect.bisect_right(
+            self.timestamps, timestamp - avg_hrs * 60 * 60)
+        last = bisect.bisect_left(self.timestamps, timestamp)
+        return (first, last)
+
+    def get_sum(self, first: int, last: int) -> int:
+        # The int64 prefix sums may wrap around on long datasets of expensive coins, yet a window sum
+        # is positive and far below 2 ** 64, thus their difference modulo 2 ** 64 is exact
+        return (int(self.prefix_sum[last]) - int(self.prefix_sum[first])) % (1 << 64)
+
+    def get_avg_price(self, avg_hrs: int, timestamp: int) -> float:
+        # Average of the prices in the last avg_hrs hours before the timestamp, the same exact mean
+        # of get_avg_price of the live invester
+        (first, last) = self.get_window(avg_hrs, timestamp)
+
+        # A window without samples (E.g. on a short prefix of the data) has no average
+        if last == first:
+            return float("nan")
+        return self.get_sum(first, last) / (PRICE_SCALE * (last - first))
+
+
+def compute_prefix_sum(prices, prefix_sum: np.ndarray):
+    # Fixed point prefix sum of the prices into an int64 array one element longer
+    prefix_sum[0] = 0
+    np.cumsum(to_fixed_point_array(prices), out=prefix_sum[1:])